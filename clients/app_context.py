@@ -0,0 +1,48 @@
+#region imports and variables
+import threading
+from typing import Optional
+from clients.ss_client import SmartsheetClient
+from clients.eg_client import EgnyteClient
+from configs.app_config import ss_config, eg_config
+import logging
+from configs.setup_logger import setup_logger
+logger = setup_logger(__name__, level=logging.DEBUG)
+#endregion
+
+class AppContext():
+    '''
+    The configs and clients of one run. Configs are read once on first use (configs.app_config) and each client is
+    built the first time something asks for it, so importing main.py (or a REPL / bench session) costs no config
+    reads, no sdk setup and no egnyte user download until a client is actually needed.
+    '''
+    def __init__(self, refresh_user_cache:Optional[bool]=None):
+        '''refresh_user_cache=None uses eg_config "refresh_user_cache" (default False)'''
+        self.ss_config = ss_config
+        self.eg_config = eg_config
+        self.refresh_user_cache = refresh_user_cache
+        self.clients = {}
+        # reentrant: eg_async_client builds eg_client while holding it
+        self.lock = threading.RLock()
+
+    def client(self, name:str, build):
+        '''returns the named client, build() makes it on first use'''
+        with self.lock:
+            if name not in self.clients:
+                self.clients[name] = build()
+            return self.clients[name]
+    def is_built(self, name:str) -> bool:
+        '''True if the named client was used this run (so end-of-run work never builds one just to find it idle)'''
+        with self.lock:
+            return name in self.clients
+    @property
+    def ss_client(self) -> SmartsheetClient:
+        return self.client("ss_client", SmartsheetClient)
+    @property
+    def eg_client(self) -> EgnyteClient:
+        return self.client("eg_client", lambda: EgnyteClient(refresh_user_cache=self.eg_config.get("refresh_user_cache", False)
+                                                             if self.refresh_user_cache is None else self.refresh_user_cache))
+    @property
+    def eg_async_client(self):
+        # imported here so httpx is only loaded by runs that update egnyte folders
+        from clients.eg_async_client import AsyncEgnyteClient
+        return self.client("eg_async_client", lambda: AsyncEgnyteClient(self.eg_client))
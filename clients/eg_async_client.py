@@ -0,0 +1,207 @@
+#region imports and variables
+import re
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from typing import Optional
+from urllib.parse import urlparse
+import httpx
+import requests
+from clients.eg_client import EgnyteClient, eg_api_url
+from clients.ss_client import ProjectObj
+from clients.rate_limiter import rate_limiter, retry_statuses
+from clients.instrumentation import recorder
+from configs.app_config import eg_config
+import logging
+from configs.setup_logger import setup_logger
+logger = setup_logger(__name__, level=logging.DEBUG)
+#endregion
+
+class AsyncEgnyteClient():
+    '''
+    asyncio version of EgnyteClient on httpx.AsyncClient. The update path (folder path + permission report lookups,
+    group rename / membership, folder rename) is native coroutines over one pooled connection set, so independent calls
+    run together on a single thread. Every call takes a token from the same per-host rate limiter as the sync session,
+    gets the same 429/503 retries and is recorded as one CallRecord (clients.rate_limiter, clients.instrumentation).
+    EgnyteClient methods that are not ported here (folder creation, user directory) can still be awaited: they run on a
+    worker thread. Caches and the user directory are the wrapped EgnyteClient's.
+
+    The coroutines run on one event loop owned by the client (a daemon thread started on first use). run() is the sync
+    facade: it hands a coroutine to that loop and blocks until it is done, so every row's updates share one loop and pool.
+    '''
+    def __init__(self, client:Optional[EgnyteClient]=None, pool_size:Optional[int]=None):
+        '''pool_size = most connections open at once (default eg_config "async_pool_size", 10)'''
+        self.client = client or EgnyteClient()
+        self.pool_size = pool_size or eg_config.get("async_pool_size", 10)
+        self.loop = None
+        self.http = None
+        self.loop_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        '''EgnyteClient methods without a coroutine here are awaited on a worker thread, other attributes are the client's'''
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+        call.__name__ = name
+        call.__doc__ = attr.__doc__
+        return call
+    #region event loop
+    def start_loop(self) -> asyncio.AbstractEventLoop:
+        with self.loop_lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="eg-async", daemon=True).start()
+                self.loop = loop
+            return self.loop
+    def run(self, coro):
+        '''runs a coroutine of this client on its event loop and returns the result, callable from any (sync) thread;
+        the caller's instrumentation tags (SAAS row + phase) stay on the calls the coroutine makes'''
+        return asyncio.run_coroutine_threadsafe(self.in_context(coro, contextvars.copy_context()), self.start_loop()).result()
+    async def in_context(self, coro, context:contextvars.Context):
+        # the task runs in its own copy of the loop thread's context, the caller's values are set in there
+        for var, value in context.items():
+            var.set(value)
+        return await coro
+    def close(self):
+        '''closes the connection pool and stops the loop (a later run() starts a new one)'''
+        with self.loop_lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+        if self.http is not None:
+            asyncio.run_coroutine_threadsafe(self.http.aclose(), loop).result()
+            self.http = None
+        loop.call_soon_threadsafe(loop.stop)
+    #endregion
+    #region helper funcs
+    def http_client(self) -> httpx.AsyncClient:
+        '''the pooled async client, made on the loop the first time a request needs it'''
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                headers={"Authorization": f"Bearer {self.client.egnyte_token}", "Content-Type": "application/json"},
+                timeout=self.client.timeout,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size))
+        return self.http
+    async def send(self, method:str, url:str, data:Optional[str]):
+        transport = rate_limiter.transport
+        if transport is None:
+            return await self.http_client().request(method, url, content=data)
+        # the record / replay transports (tools/replay.py) speak requests, so they get the sync session's request on a worker thread
+        request = self.client.session.prepare_request(requests.Request(method, url, data=data))
+        adapter = self.client.session.get_adapter(url)
+        return await asyncio.to_thread(transport.send, adapter.network_send, request, timeout=self.client.timeout)
+    async def api_request(self, method:str, path:str, data:Optional[str]=None):
+        '''every egnyte endpoint goes through here, path is relative to /pubapi (ex. "/v1/fs/Shared")
+        returns the response (status_code / content / json() like the sync client's)'''
+        url = eg_api_url + path
+        parsed_url = urlparse(url)
+        attempt = 0
+        started_at = time.perf_counter()
+        while True:
+            await rate_limiter.acquire_async(parsed_url.hostname)
+            try:
+                resp = await self.send(method, url, data)
+            except (httpx.HTTPError, requests.exceptions.RequestException):
+                self.record(method, parsed_url, None, data, 0, started_at, attempt)
+                raise
+            if resp.status_code not in retry_statuses or attempt >= rate_limiter.max_retries:
+                self.record(method, parsed_url, resp.status_code, data, len(resp.content or b""), started_at, attempt)
+                return resp
+            delay = rate_limiter.retry_delay(resp, attempt)
+            logger.debug(f"{parsed_url.hostname} answered {resp.status_code}, retrying in {delay:.1f}s ({attempt + 1}/{rate_limiter.max_retries})")
+            await asyncio.sleep(delay)
+            attempt += 1
+    def record(self, method:str, url, status, data:Optional[str], bytes_in:int, started_at:float, retries:int):
+        '''one CallRecord per logical call, same shape as RateLimitedAdapter.record'''
+        recorder.record(
+            host=url.hostname, method=method, path=url.path, status=status, bytes_out=len(data.encode()) if data else 0,
+            bytes_in=bytes_in, seconds=time.perf_counter() - started_at, retries=retries)
+    def return_dict_from_api_resp(self, resp, variable_name:str) -> dict:
+        return self.client.return_dict_from_api_resp(resp, variable_name)
+    async def handle_cached_paths(self, folder_id:str) -> str:
+        '''checked for chached paths by folder id (shared with the sync client), otherwise loads it'''
+        if self.client.cached_paths.get(folder_id) == None:
+            self.client.cached_paths[folder_id] = (await self.get_folder_from_id(folder_id)).get("path")
+        return self.client.cached_paths.get(folder_id)
+    #endregion
+    #region folders
+    async def get_folder_from_id(self, folder_id:str) -> dict:
+        get_folder_resp = await self.api_request("GET", f"/v1/fs/ids/folder/{folder_id}")
+        return self.return_dict_from_api_resp(get_folder_resp, 'get_folder_dict')
+    async def generate_folder_update_url(self, folder_id:str) -> str:
+        url_path = re.sub(r"\s", "%20", await self.handle_cached_paths(folder_id))
+        return '/v1/fs' + url_path
+    async def change_folder_name(self, folder_id:str) -> dict:
+        data = '{"action":"move", "destination":"' + f"{await self.handle_cached_paths(folder_id)}" + '"}'
+
+        folder_name_change_resp = await self.api_request("POST", await self.generate_folder_update_url(folder_id), data=data)
+        return self.return_dict_from_api_resp(folder_name_change_resp, 'folder_name_change_dict')
+    #endregion
+    #region permissions groups
+    async def group_is_ready(self, group_id:int) -> bool:
+        return (await self.api_request("GET", f"/v2/groups/{group_id}")).status_code == 200
+    async def generate_permissions_url(self, folder_id:str) -> str:
+        url_path = re.sub(r"\s", "%20", await self.handle_cached_paths(folder_id))
+        return '/v2/perms' + url_path
+    async def folderid_to_permission_report(self, folder_id:str) -> dict:
+        try:
+            permissions_report_resp = await self.api_request("GET", await self.generate_permissions_url(folder_id))
+            return self.return_dict_from_api_resp(permissions_report_resp, 'permissions_report_dict')
+        except Exception:
+            logger.warning("generated permission url did not yield folder that existed")
+            return False
+    async def find_id_from_group_name(self, main_permission_group:str) -> int:
+        url_group_name = re.sub(r"\s", "%20", main_permission_group)
+        path = '/v2/groups?filter=displayName%20eq%20"' + f"{url_group_name}" + '"'
+        permission_group_resp = await self.api_request("GET", path)
+        permission_group_dict = self.return_dict_from_api_resp(permission_group_resp, 'permission_group_dict')
+        return permission_group_dict.get("resources")[0].get("id")
+    async def return_group_id_to_update(self, folder_id:str) -> tuple[str, str]:
+        '''same as EgnyteClient.return_group_id_to_update: the first group with full permission on the folder, as (id, name)'''
+        permissions_report_dict = await self.folderid_to_permission_report(folder_id)
+        if permissions_report_dict:
+            main_permission_group = self.client.process_project_permission_report(permissions_report_dict)
+            if main_permission_group:
+                return await self.find_id_from_group_name(main_permission_group), main_permission_group
+        return "", ""
+    async def change_permission_group_name(self, group_id:str, correct_project_name:str) -> dict:
+        data = '{"displayName": "' + f"{correct_project_name}" '"}'
+        change_group_name_resp = await self.api_request("PATCH", f"/v2/groups/{group_id}", data=data)
+        return self.return_dict_from_api_resp(change_group_name_resp, 'change_group_name_dict')
+    async def get_permission_group_members(self, group_id:str) -> dict:
+        permission_group_resp = await self.api_request("GET", f"/v2/groups/{group_id}")
+        return self.return_dict_from_api_resp(permission_group_resp, 'permission_group_dict')
+    async def reconcile_group_members(self, group_id:int, project:ProjectObj, exact:Optional[bool]=None, display_name:Optional[str]=None) -> dict:
+        '''same as EgnyteClient.reconcile_group_members, the group and the project's member ids (user directory) are looked up together'''
+        if exact is None:
+            exact = eg_config.get("group_sync_exact", False)
+        permission_group_dict, target_ids = await asyncio.gather(
+            self.get_permission_group_members(group_id),
+            asyncio.to_thread(self.client.project_member_ids, project))
+        current_ids = {member.get("value") for member in permission_group_dict.get("members", [])}
+
+        to_add = [user_id for user_id in target_ids if user_id not in current_ids]
+        to_remove = [user_id for user_id in current_ids if user_id not in target_ids] if exact else []
+        if exact and (to_add or to_remove):
+            await self.set_group_members_api(target_ids, group_id, display_name or permission_group_dict.get("displayName"))
+        elif to_add:
+            await self.add_group_members_api(to_add, group_id)
+        logger.debug(f"group {group_id} membership: added {to_add}, removed {to_remove}")
+        return {"added": to_add, "removed": to_remove}
+    async def update_group_members_api(self, user_id:int, group_id:int):
+        await self.add_group_members_api([user_id], group_id)
+    async def add_group_members_api(self, user_ids:list, group_id:int) -> dict:
+        data = json.dumps({"members": [{"value": user_id} for user_id in user_ids]})
+
+        group_change_resp = await self.api_request("PATCH", f"/v2/groups/{group_id}", data=data)
+        return self.return_dict_from_api_resp(group_change_resp, 'group_change_dict')
+    async def set_group_members_api(self, user_ids:list, group_id:int, display_name:str) -> dict:
+        data = json.dumps({"displayName": display_name, "members": [{"value": user_id} for user_id in user_ids]})
+
+        group_change_resp = await self.api_request("PUT", f"/v2/groups/{group_id}", data=data)
+        return self.return_dict_from_api_resp(group_change_resp, 'group_change_dict')
+    #endregion
@@ -1,32 +1,175 @@
 #region imports and variables
 from pathlib import Path
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from smartsheet.exceptions import ApiError
 import requests
-from requests.structures import CaseInsensitiveDict
+from clients.rate_limiter import mount_rate_limiter
+from clients.instrumentation import propagate
 import json
 import re
-import pandas as pd
 from clients.ss_client import SmartsheetClient, ProjectObj, PostingData
 from dataclasses import dataclass
+from typing import Optional, List, Callable
 import logging
+from configs.app_config import eg_config
 from configs.setup_logger import setup_logger
 logger = setup_logger(__name__, level=logging.DEBUG)
-eg_config = json.loads(Path("configs/eg_config.json").read_text())
-egnyte_token = eg_config["egnyte_token"]
+eg_api_url = "https://dowbuilt.egnyte.com/pubapi"
+# on-disk copy of the egnyte user list (eg_config "user_cache_path"), bump the version whenever the stored record shape changes
+eg_user_cache_version = 1
+# largest page the users endpoint accepts
+eg_user_page_size = 100
+#endregion
+
+#region Models
+@dataclass(frozen=True, slots=True)
+class EgUser:
+    id: int
+    name: str
+    email: str
+class EgUserDirectory:
+    '''the egnyte users indexed by email (case-insensitive), id and formatted name, built once from the user list'''
+    def __init__(self, eg_user_list:list):
+        self.users_by_email = {}
+        self.users_by_id = {}
+        self.users_by_name = {}
+        for user_dict in eg_user_list:
+            user = EgUser(id=user_dict.get("id"), name=user_dict.get("name"), email=user_dict.get("email"))
+            if user.email:
+                self.users_by_email[user.email.lower()] = user
+            self.users_by_id[user.id] = user
+            if user.name:
+                self.users_by_name[user.name] = user
+
+    def __len__(self):
+        return len(self.users_by_id)
+    def by_email(self, email:str) -> Optional[EgUser]:
+        if not email:
+            return None
+        return self.users_by_email.get(email.strip().lower())
+    def by_id(self, user_id:int) -> Optional[EgUser]:
+        return self.users_by_id.get(user_id)
+    def by_name(self, name:str) -> Optional[EgUser]:
+        return self.users_by_name.get(name)
+@dataclass
+class CopyJob:
+    source_path: str
+    destination_path: str
+    submitted_at: float
+    finished_at: Optional[float] = None
+    status: str = "pending" # pending / done / failed
+    error: Optional[str] = None
+    on_done: Optional[Callable] = None # called with the job once the copy landed, an error in it fails the job
+
+    @property
+    def duration_s(self) -> Optional[float]:
+        return None if self.finished_at is None else self.finished_at - self.submitted_at
 #endregion
 
 class EgnyteClient():
     '''words'''
-    def __init__(self):
+    def __init__(self, refresh_user_cache:bool=False):
+        '''refresh_user_cache=True ignores the on-disk user list and refetches it from egnyte the first time users are needed'''
         logger.debug('Initializing Egnyte Client...')
         self.eg_link = ""
-        self.egnyte_token = egnyte_token
-        self.eg_user_list = self.recusively_generate_eg_user_list(1, [])
+        self.egnyte_token = eg_config["egnyte_token"]
+        self.user_cache_path = Path(eg_config.get("user_cache_path", "configs/eg_user_cache.json"))
+        self.timeout = eg_config.get("timeout", 30)
+        self.session = self.build_session(eg_config.get("pool_size", 10))
+        self.refresh_user_cache = refresh_user_cache
+        self.user_cache_ttl = eg_config.get("user_cache_ttl_hours", 24) * 3600
+        self.loaded_eg_user_list = None
+        self.loaded_eg_users = None
+        # True once this run's directory came from the users api (not the disk cache), find_eg_user refetches at most once
+        self.eg_users_from_api = False
+        self.eg_users_lock = threading.Lock()
         self.cached_paths = {}
+        self.cached_folder_trees = {}
+        # template copies run in the background (eg_config "copy_workers" at a time), main() waits for them at the end of the run
+        self.template_copies = TemplateCopier(self, max_workers=eg_config.get("copy_workers", 2))
+
+    #region user directory
+    @property
+    def eg_users(self) -> EgUserDirectory:
+        '''the indexed user directory, loaded the first time a permission method needs it'''
+        with self.eg_users_lock:
+            if self.loaded_eg_users is None:
+                self.loaded_eg_user_list = self.load_eg_user_list()
+                self.loaded_eg_users = EgUserDirectory(self.loaded_eg_user_list)
+        return self.loaded_eg_users
+    def find_eg_user(self, email:str) -> Optional[EgUser]:
+        '''by_email on the directory, an email that is not in a directory loaded from the disk cache refetches the
+        directory from egnyte once per run (users hired since the cache was written)'''
+        user = self.eg_users.by_email(email)
+        if user is not None or not email:
+            return user
+        with self.eg_users_lock:
+            if not self.eg_users_from_api:
+                logger.info(f"{email} is not in the cached egnyte user list, refetching it")
+                self.loaded_eg_user_list = self.fetch_eg_user_list()
+                self.loaded_eg_users = EgUserDirectory(self.loaded_eg_user_list)
+        return self.loaded_eg_users.by_email(email)
+    @property
+    def eg_user_list(self) -> list:
+        '''raw user dicts ({"name", "email", "id"}) behind eg_users'''
+        self.eg_users
+        return self.loaded_eg_user_list
+    def read_eg_user_cache(self) -> Optional[list]:
+        '''returns the cached user list if the file exists, matches the current version and is younger than the ttl'''
+        try:
+            cache = json.loads(self.user_cache_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if cache.get("version") != eg_user_cache_version:
+            logger.debug("egnyte user cache is from an older version, ignoring it")
+            return None
+        if time.time() - cache.get("fetched_at", 0) > self.user_cache_ttl:
+            logger.debug("egnyte user cache is stale, ignoring it")
+            return None
+        return cache.get("users")
+    def write_eg_user_cache(self, eg_user_list:list):
+        '''writes atomically so a crashed run never leaves half a cache behind'''
+        cache = {"version": eg_user_cache_version, "fetched_at": time.time(), "users": eg_user_list}
+        tmp_path = self.user_cache_path.with_suffix(".tmp")
+        try:
+            tmp_path.write_text(json.dumps(cache))
+            tmp_path.replace(self.user_cache_path)
+        except OSError as e:
+            logger.warning(f"could not write egnyte user cache: {e}")
+    def load_eg_user_list(self) -> list:
+        '''on-disk cache first (unless refresh_user_cache), then the users api'''
+        if not self.refresh_user_cache:
+            eg_user_list = self.read_eg_user_cache()
+            if eg_user_list is not None:
+                logger.debug(f"loaded {len(eg_user_list)} egnyte users from cache")
+                return eg_user_list
+        return self.fetch_eg_user_list()
+    def fetch_eg_user_list(self) -> list:
+        '''the users api, the result replaces the on-disk cache'''
+        logger.info("Fetching the Egnyte user list...")
+        eg_user_list = self.generate_eg_user_list()
+        self.eg_users_from_api = True
+        self.write_eg_user_cache(eg_user_list)
+        return eg_user_list
+    #endregion
 
     #region helper funcs
+    def build_session(self, pool_size:int) -> requests.Session:
+        '''one keep-alive session for every egnyte call so the TCP/TLS handshake is only paid once per pooled connection,
+        the shared rate limiter is mounted on it (token bucket + 429/503 retries)'''
+        session = mount_rate_limiter(requests.Session(), pool_size)
+        session.headers.update({
+            "Authorization": f"Bearer {self.egnyte_token}",
+            "Content-Type": "application/json"
+        })
+        return session
+    def api_request(self, method:str, path:str, **kwargs) -> requests.models.Response:
+        '''every egnyte endpoint goes through here, path is relative to /pubapi (ex. "/v1/fs/Shared")'''
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, eg_api_url + path, **kwargs)
     def return_dict_from_api_resp(self, resp:requests.models.Response, variable_name:str) -> dict:
         '''takes in egnyte API responses and does standard debug log and converting to dict to avoid errrors'''
         # Parse JSON content into a dictionary
@@ -37,6 +180,21 @@ class EgnyteClient():
 
         # Return the dictionary
         return resp_dict
+    def poll_until(self, check, what:str, timeout:Optional[float]=None, max_interval:float=5):
+        '''calls check() until it returns something truthy and returns that, waiting eg_config "ready_poll_interval" (0.5s)
+        between tries and doubling up to max_interval, raises TimeoutError after timeout (default eg_config "ready_timeout", 30s)'''
+        interval = eg_config.get("ready_poll_interval", 0.5)
+        if timeout is None:
+            timeout = eg_config.get("ready_timeout", 30)
+        deadline = time.monotonic() + timeout
+        while True:
+            result = check()
+            if result:
+                return result
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"{what} was not ready after {timeout}s")
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
     def handle_cached_paths(self, folder_id:str) -> str:
         '''checked for chached paths by folder id, otherwise loads it'''
         if self.cached_paths.get(folder_id) == None:
@@ -66,31 +224,18 @@ class EgnyteClient():
         #region new
     def get_folder_from_id(self, folder_id:str) -> str:
             '''uses folder id to find folder (used to extrapolate path, but could do more)'''
-            url = f"https://dowbuilt.egnyte.com/pubapi/v1/fs/ids/folder/{folder_id}"
-            headers = CaseInsensitiveDict()
-            headers["Authorization"] = f"Bearer {egnyte_token}"
-            get_folder_resp = requests.get(url, headers=headers)
+            get_folder_resp = self.api_request("GET", f"/v1/fs/ids/folder/{folder_id}")
             return self.return_dict_from_api_resp(get_folder_resp, 'get_folder_dict')
     def create_folder(self, project:ProjectObj) -> dict:
         '''uses api to create folder'''
-        url=f'https://dowbuilt.egnyte.com/pubapi/v1/fs/{project.eg_path}'
-        
-        headers = CaseInsensitiveDict()
-        headers["Authorization"] = f"Bearer {egnyte_token}"
-        headers["Content-Type"] = "application/json"
-
         data = '{"action":"add_folder"}'
         
-        folder_api_resp = requests.post(url, headers=headers, data=data)
+        folder_api_resp = self.api_request("POST", f"/v1/fs/{project.eg_path}", data=data)
         
         return self.return_dict_from_api_resp(folder_api_resp, 'folder_api_dict')
     def set_permissions_on_new_folder(self, project:ProjectObj) -> requests.models.Response:
         '''creates the permission set that we use for projects (w state level, project level, and project-folder level)
         for some reason this api call does not have a .content responce fyi'''
-        url = f"https://dowbuilt.egnyte.com/pubapi/v2/perms/{project.eg_path}"
-        headers = CaseInsensitiveDict()
-        headers["Authorization"] = f"Bearer {egnyte_token}"
-        headers["Content-Type"] = "application/json"
         if project.state != "CA":
             state = project.state
         elif project.region == "NORCAL":
@@ -105,116 +250,120 @@ class EgnyteClient():
         data = '{"groupPerms":{"' + f"{project.name}_{project.enum}" + '":"Full", "State_' + state + '":"Editor", "Projects": "Editor"'+ f'{special_proj_add if project.job_type == "Special Projects" or project.job_type == "Small Projects" else ""}'+'}}'
         logger.debug(f"permissions setting: {data}")
 
-        folder_permission_api_resp = requests.post(url, headers=headers, data=data)
+        folder_permission_api_resp = self.api_request("POST", f"/v2/perms/{project.eg_path}", data=data)
 
         return folder_permission_api_resp 
+    def set_permissions_when_ready(self, project:ProjectObj, group_id:int) -> requests.models.Response:
+        '''the folder permissions name the new permission group (generate_permission_group only returns it once egnyte serves it),
+        they are retried while the perms endpoint still answers 400/404 for it, any other error response is raised right away'''
+        if not group_id:
+            raise ValueError(f"no permission group to set on {project.eg_path}")
+        def attempt():
+            resp = self.set_permissions_on_new_folder(project)
+            if resp.status_code in (400, 404):
+                return None
+            resp.raise_for_status()
+            # (done, resp): a Response is falsy for error statuses, poll_until needs a truthy result to stop on
+            return True, resp
+        _, resp = self.poll_until(attempt, f"permissions on {project.eg_path}")
+        return resp
     def copy_folders_to_new_location(self, source_path:str, destination_path:str) -> dict:
-        '''copies folder(s) from source to destination, inherenting permissions of destination'''
-        url = f"https://dowbuilt.egnyte.com/pubapi/v1/fs/{source_path}"
-
-        headers = CaseInsensitiveDict()
-        headers["Authorization"] = f"Bearer {egnyte_token}"
-        headers["Content-Type"] = "application/json"
-
+        '''copies folder(s) from source to destination, inherenting permissions of destination (blocks until egnyte is done,
+        template_copies.submit() runs it in the background), raises on an error response'''
         data = '{"action":"copy", "destination":"' + destination_path + '", "permissions": "inherit_from_parent"}'
 
-        folder_move_api_resp = requests.post(url, headers=headers, data=data)
-        folder_move_api_dict =  {json.dumps(json.loads(folder_move_api_resp.content.decode('utf-8')), indent=4)}
-        logger.debug(f'folder move api dict: {folder_move_api_dict}')
+        folder_move_api_resp = self.api_request("POST", f"/v1/fs/{source_path}", data=data)
+        folder_move_api_resp.raise_for_status()
         return self.return_dict_from_api_resp(folder_move_api_resp, 'folder_move_api_dict')
+    def folder_listing(self, path:str) -> tuple[set, set]:
+        '''names of the folders and of the files directly inside path'''
+        resp = self.api_request("GET", f"/v1/fs/{path}")
+        resp.raise_for_status()
+        listing = resp.json()
+        return {folder.get("name") for folder in listing.get("folders", [])}, {file.get("name") for file in listing.get("files", [])}
+    def folder_tree(self, path:str) -> dict:
+        '''{path relative to path ("" = path itself): (folder names, file names)} for path and every folder below it'''
+        tree = {}
+        pending = [""]
+        while pending:
+            relative_path = pending.pop()
+            folders, files = self.folder_listing(f"{path}/{relative_path}" if relative_path else path)
+            tree[relative_path] = (folders, files)
+            pending += [f"{relative_path}/{folder}" if relative_path else folder for folder in folders]
+        return tree
+    def copy_landed(self, source_path:str, destination_path:str) -> bool:
+        '''True once every folder and file of source_path's tree (cached) is in destination_path, the destination is listed
+        parents first and the check stops at the first missing entry, so an unfinished copy costs a few requests per poll'''
+        if source_path not in self.cached_folder_trees:
+            self.cached_folder_trees[source_path] = self.folder_tree(source_path)
+        for relative_path, (folders, files) in sorted(self.cached_folder_trees[source_path].items()):
+            landed_folders, landed_files = self.folder_listing(f"{destination_path}/{relative_path}" if relative_path else destination_path)
+            if not (folders <= landed_folders and files <= landed_files):
+                return False
+        return True
     def restrict_move_n_delete(self, project:ProjectObj) -> dict:
         '''changes default setting so full owners cannot move/delete root folder, just folders inside'''
-        url = f"https://dowbuilt.egnyte.com/pubapi/v1/fs/{project.eg_path}"
-
-        headers = CaseInsensitiveDict()
-        headers["Authorization"] = f"Bearer {egnyte_token}"
-        headers["Content-Type"] = "application/json"        
-
         data = '{"restrict_move_delete": "true"}'       
 
-        restriction_api_resp= requests.patch(url, headers=headers, data=data)
+        restriction_api_resp= self.api_request("PATCH", f"/v1/fs/{project.eg_path}", data=data)
         return self.return_dict_from_api_resp(restriction_api_resp, 'restriction_api_dict')
-    def generate_folder_link(self, project:ProjectObj):
-        '''gets folder, finds id, and then attaches to project object to be posted from ss_client'''
-        url = f"https://dowbuilt.egnyte.com/pubapi/v1/fs/{project.eg_path}"
-
-        headers = CaseInsensitiveDict()
-        headers["Authorization"] = f"Bearer {egnyte_token}"
-
-
-        get_folder_api_resp = requests.get(url, headers=headers)
-        get_folder_api_dict = self.return_dict_from_api_resp(get_folder_api_resp, 'get_folder_api_dict')
-        id = get_folder_api_dict.get("folder_id")
+    def generate_folder_link(self, project:ProjectObj, folder_id:Optional[str]=None):
+        '''attaches the folder's link to project object to be posted from ss_client,
+        folder_id comes from create_folder's response, the folder is only looked up when it is not given'''
+        id = folder_id
+        if not id:
+            get_folder_api_resp = self.api_request("GET", f"/v1/fs/{project.eg_path}")
+            get_folder_api_dict = self.return_dict_from_api_resp(get_folder_api_resp, 'get_folder_api_dict')
+            id = get_folder_api_dict.get("folder_id")
         project.eg_link  = 'https://dowbuilt.egnyte.com/navigate/folder/' + id    
         #endregion
         #region update
     def generate_folder_update_url(self, folder_id:str) -> str:
-        '''generates the url the api needs in the folder name change post request'''
-        api_url = 'https://dowbuilt.egnyte.com/pubapi/v1/fs'
+        '''generates the api path (relative to /pubapi) the folder name change post request needs'''
         # Changing spaces back to %20
         url_path = re.sub("\s", "%20", self.handle_cached_paths(folder_id))
-        return api_url + url_path
+        return '/v1/fs' + url_path
     def change_folder_name(self, folder_id:str)-> dict:
-            headers = CaseInsensitiveDict()
-            headers["Authorization"] = f"Bearer {egnyte_token}"
-            headers["Content-Type"] = "application/json"
-
             data = '{"action":"move", "destination":"' + f"{self.handle_cached_paths(folder_id)}" + '"}'
 
-            folder_name_change_resp = requests.post(self.generate_folder_update_url(folder_id), headers=headers, data=data)
+            folder_name_change_resp = self.api_request("POST", self.generate_folder_update_url(folder_id), data=data)
             return self.return_dict_from_api_resp(folder_name_change_resp, 'folder_name_change_dict')
         #endregion
     #endregion
     #region permissions groups
         #region new
-    def eg_user_list_api_call(self, index:int, eg_user_list:list) -> bool:
+    def eg_user_list_api_call(self, index:int, eg_user_list:list) -> int:
         """
-        Makes an API call to the Egnyte user list endpoint to fetch user data.
+        Makes an API call to the Egnyte user list endpoint to fetch one page of user data.
 
-        This function fetches up to 100 user records starting from the specified index
-        and appends them to the provided `eg_user_list`. If no more users are found, 
-        the function returns `False` to signal that recursion should stop.
+        This function fetches up to `eg_user_page_size` user records starting from the specified
+        (1-based) index and appends them to the provided `eg_user_list`.
 
         Args:
             index (int): The starting index for the API call.
             eg_user_list (list): A list to store user dictionaries containing 'name', 'email', and 'id'.
 
         Returns:
-            bool: 
-                - `True` if more users are available for fetching.
-                - `False` if no more users are available, indicating the end of the data.
+            int: The `totalResults` egnyte reports for the whole directory.
         """
-        recursion_bool = True
-
-        url = f"https://dowbuilt.egnyte.com/pubapi/v2/users?count=100&startIndex={index}"
-        headers = CaseInsensitiveDict()
-        headers["Authorization"] = f"Bearer {egnyte_token}"
-
-        resp = requests.get(url, headers=headers)
-        resp_dict = json.loads(resp.content.decode("utf-8"))
-        information_pretty = json.dumps(resp_dict, indent=4)
-        information_dict = json.loads(information_pretty)
+        resp = self.api_request("GET", f"/v2/users?count={eg_user_page_size}&startIndex={index}")
+        resp.raise_for_status()
+        information_dict = json.loads(resp.content.decode("utf-8"))
 
-        for user in information_dict.get("resources"):
-            name = user.get("name"). get("formatted")
+        for user in information_dict.get("resources", []):
+            name = user.get("name", {}).get("formatted")
             user_id = user.get("id")
             email = user.get("email")
             eg_user_dict = {"name": name, "email": email, "id": user_id}
             eg_user_list.append(eg_user_dict)
-        if len(information_dict.get("resources")) == 0:
-            recursion_bool = False
 
-        return recursion_bool
-    def recusively_generate_eg_user_list(self, index:int, eg_user_list:list) ->list:
+        return int(information_dict.get("totalResults", 0))
+    def generate_eg_user_list(self) -> list:
         """
-        Recursively retrieves all user data from the Egnyte API and returns the complete user list. 
+        Retrieves all user data from the Egnyte API and returns the complete user list.
 
-        This function calls `eg_user_list_api_call` to fetch user data in batches of 100.
-        It continues making API calls with incremented indices until all user data is retrieved.    
-
-        Args:
-            index (int): The starting index for the initial API call. Typically `0`.
-            eg_user_list (list): A list to store user dictionaries. Should be empty initially.  
+        The first page gives `totalResults`, the remaining pages are then fetched concurrently
+        (eg_config "user_fetch_workers", default 4) and merged back in index order.
 
         Returns:
             list: A list of dictionaries where each dictionary contains:
@@ -222,34 +371,42 @@ class EgnyteClient():
                 - 'email': The email address of the user.
                 - 'id': The unique ID of the user.
         """
-        recursion_bool = self.eg_user_list_api_call(index, eg_user_list)
-        if recursion_bool == True:
-            new_index = int(index) + 100
-            self.recusively_generate_eg_user_list(new_index, eg_user_list)
-
+        eg_user_list = []
+        total_results = self.eg_user_list_api_call(1, eg_user_list)
+
+        remaining_indexes = range(1 + eg_user_page_size, total_results + 1, eg_user_page_size)
+        pages = [[] for _ in remaining_indexes]
+        if pages:
+            max_workers = max(1, min(eg_config.get("user_fetch_workers", 4), len(pages)))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # list() so any page error is raised here rather than swallowed, propagate() keeps the caller's tags on the page calls
+                list(executor.map(propagate(self.eg_user_list_api_call), remaining_indexes, pages))
+        for page in pages:
+            eg_user_list.extend(page)
+
+        logger.debug(f"fetched {len(eg_user_list)}/{total_results} egnyte users in {len(pages) + 1} pages")
         return eg_user_list
-    def prepare_new_permission_group(self, project:ProjectObj) -> list:
-        '''looks up user emails and maps to egnyte user values so future api calls can be done simply'''
-        logger.info(f"Configuring Folder Permissions for {project.name}...")
-        permission_members = []
+    def project_member_ids(self, project:ProjectObj) -> list:
+        '''the target member set of a project's permission group: egnyte ids of the project's user emails (no egnyte account = skipped)'''
+        member_ids = []
         for employee in project.user_emails:
             if employee == "none":
                 pass
             else:
-                for user in self.eg_user_list:
-                    if employee == user.get("email"):
-                        permission_members.append({"value":user.get("id")})
-        if permission_members == []:
+                user = self.find_eg_user(employee)
+                if user and user.id not in member_ids:
+                    member_ids.append(user.id)
+        if member_ids == []:
             # to make it never empty, the group adds me (ariel) if no one else...
-            permission_members.append({"value":309})
-        return permission_members
+            member_ids.append(309)
+        return member_ids
+    def prepare_new_permission_group(self, project:ProjectObj) -> list:
+        '''looks up user emails and maps to egnyte user values so the group is created with its full member set in one call'''
+        logger.info(f"Configuring Folder Permissions for {project.name}...")
+        return [{"value":user_id} for user_id in self.project_member_ids(project)]
     def generate_permission_group(self, permission_members:list, project:ProjectObj) -> int:
-        url = "https://dowbuilt.egnyte.com/pubapi/v2/groups"
-
-        headers = CaseInsensitiveDict()
-        headers["Authorization"] = f"Bearer {egnyte_token}"
-        headers["Content-Type"] = "application/json"
-
+        '''creates the project's permission group and returns its id once egnyte serves the group (polled, this used to be
+        a fixed sleep), so anything that names the group right after (folder permissions) does not race its creation'''
         logger.debug(f"permission_members: {permission_members}")
 
         if len(permission_members) == 0:
@@ -259,25 +416,27 @@ class EgnyteClient():
             data_raw = '{"displayName":"' +  project.name+"_"+project.enum +'", "members":' + str(permission_members) + '}'
             data = re.sub("\'", '"', data_raw)
 
-        time.sleep(5)
-
-        new_permissions_group_api_resp = requests.post(url, headers=headers, data=data)
+        new_permissions_group_api_resp = self.api_request("POST", "/v2/groups", data=data)
         new_permissions_group_api_dict = self.return_dict_from_api_resp(new_permissions_group_api_resp, 'new_permissions_group_api_dict')
         permission_group_id = new_permissions_group_api_dict.get("id")
+        if not permission_group_id:
+            raise ValueError(f"permission group for {project.name}_{project.enum} was not created: {new_permissions_group_api_dict}")
+        self.poll_until(lambda: self.group_is_ready(permission_group_id), f"permission group {permission_group_id}")
         return permission_group_id
+    def group_is_ready(self, group_id:int) -> bool:
+        '''True once egnyte serves a newly created group'''
+        return self.api_request("GET", f"/v2/groups/{group_id}").status_code == 200
         #endregion
         #region update
     def generate_permissions_url(self, folder_id:str) -> str:
-        api_url = 'https://dowbuilt.egnyte.com/pubapi/v2/perms'
+        '''generates the api path (relative to /pubapi) of the permissions on a folder'''
         # Changing spaces back to %20
         url_path = re.sub("\s", "%20", self.handle_cached_paths(folder_id))
-        return api_url + url_path
+        return '/v2/perms' + url_path
     def folderid_to_permission_report(self, folder_id:str) -> dict:
         'uses the folder id to see the permissions set on it, and their ids'
         try:
-            headers = CaseInsensitiveDict()
-            headers["Authorization"] = f"Bearer {egnyte_token}"
-            permissions_report_resp = requests.get(self.generate_permissions_url(folder_id), headers=headers)
+            permissions_report_resp = self.api_request("GET", self.generate_permissions_url(folder_id))
             permissions_report_dict = self.return_dict_from_api_resp(permissions_report_resp, 'permissions_report_dict')
             return permissions_report_dict
         except:
@@ -304,10 +463,8 @@ class EgnyteClient():
     def find_id_from_group_name(self, main_permission_group:str) -> int:
         '''not sure what the first line does, but ult. extracts id from permission group name'''
         url_group_name = re.sub("\s", "%20", main_permission_group)
-        url = 'https://dowbuilt.egnyte.com/pubapi/v2/groups?filter=displayName%20eq%20"' + f"{url_group_name}" + '"'
-        headers = CaseInsensitiveDict()
-        headers["Authorization"] = f"Bearer {egnyte_token}"
-        permission_group_resp = requests.get(url, headers=headers)
+        path = '/v2/groups?filter=displayName%20eq%20"' + f"{url_group_name}" + '"'
+        permission_group_resp = self.api_request("GET", path)
         permission_group_dict = self.return_dict_from_api_resp(permission_group_resp, 'permission_group_dict')
         id = permission_group_dict.get("resources")[0].get("id")
         return id
@@ -324,82 +481,103 @@ class EgnyteClient():
         # because empty strings are falsey
         return "", ""
     def change_permission_group_name(self, group_id:str, correct_project_name:str):
-            url = 'https://dowbuilt.egnyte.com/pubapi/v2/groups/' + f"{group_id}" 
-            headers = CaseInsensitiveDict()
-            headers["Authorization"] = f"Bearer {egnyte_token}"
-            headers["Content-Type"] = "application/json"
-
             data = '{"displayName": "' + f"{correct_project_name}" '"}'
-            change_group_name_resp = requests.patch(url, headers=headers, data=data)
+            change_group_name_resp = self.api_request("PATCH", f"/v2/groups/{group_id}", data=data)
             return self.return_dict_from_api_resp(change_group_name_resp, 'change_group_name_dict')
     def get_permission_group_members(self, group_id:str) -> dict:
-        url = f"https://dowbuilt.egnyte.com/pubapi/v2/groups/{group_id}"
-
-        headers = CaseInsensitiveDict()
-        headers["Authorization"] = f"Bearer {egnyte_token}"
-
-
-        permission_group_resp= requests.get(url, headers=headers)
+        permission_group_resp= self.api_request("GET", f"/v2/groups/{group_id}")
         return self.return_dict_from_api_resp(permission_group_resp, 'permission_group_dict')
-    def identify_permission_updates(self, permission_group_dict:dict, project) -> list:
-        """
-        Identify permission updates for a project.
-
-        This function compares the members of the main project's permission group 
-        with the user emails associated with the project. It checks if there are 
-        any project users who are not already in the permission group. Users not 
-        in the group are added to the updates list.
-
-        Parameters:
-            permission_group_dict (dict): A dictionary containing permission group details, 
-                                          including a list of members with their IDs.
-            project: An object containing project details, including a list of user emails.
-
-        Returns:
-            list: A list of user emails that need to be added to the permission group.
-        """
-        users_in_group = []
-        for user in permission_group_dict.get("members"):
-            users_in_group.append(user.get("value"))
-
-        user_updates_list = []
-        for user in project.user_emails:
-            for account in self.eg_user_list:
-                if user == account.get("email"):
-                    id = account.get("id")
-            if id not in users_in_group:
-                user_updates_list.append(user)
-
-        return user_updates_list
-    def group_member_updates(self, group_id:int, project:ProjectObj) -> list:
-        '''takes permission group id, extrapoles members, checks against required users'''
+    def reconcile_group_members(self, group_id:int, project:ProjectObj, exact:Optional[bool]=None, display_name:Optional[str]=None) -> dict:
+        '''brings the permission group to the project's member set (project_member_ids) in at most one request
+        exact=False only adds missing users (PATCH), exact=True also drops everyone else (PUT with the full member list)
+        exact defaults to eg_config "group_sync_exact" (False)
+        display_name is the name the PUT resends (default: the name fetched here), pass it when the group is being renamed'''
+        if exact is None:
+            exact = eg_config.get("group_sync_exact", False)
         permission_group_dict = self.get_permission_group_members(group_id)
-        if permission_group_dict:
-            user_updates_list = self.identify_permission_updates(permission_group_dict, project)
-            return user_updates_list
-        return []
-    def execute_group_changes(self, updates:list, group_id:int):
-        '''manages adding individuals to permission group, executing on them one by one by finding their egnyte id and then doing the api call'''
-        for user in updates:
-            for user_data in self.eg_user_list:
-                if user == user_data.get("email"):
-                    logger.debug(f'adding {user_data.get("name")} to permission group')
-                    self.update_group_members_api(user_data.get("id"), group_id)
+        current_ids = {member.get("value") for member in permission_group_dict.get("members", [])}
+        target_ids = self.project_member_ids(project)
+
+        to_add = [user_id for user_id in target_ids if user_id not in current_ids]
+        to_remove = [user_id for user_id in current_ids if user_id not in target_ids] if exact else []
+        if exact and (to_add or to_remove):
+            self.set_group_members_api(target_ids, group_id, display_name or permission_group_dict.get("displayName"))
+        elif to_add:
+            self.add_group_members_api(to_add, group_id)
+        logger.debug(f"group {group_id} membership: added {to_add}, removed {to_remove}")
+        return {"added": to_add, "removed": to_remove}
     def update_group_members_api(self, user_id:int, group_id:int):
         '''adds user to a particular permission group'''
-        url = f"https://dowbuilt.egnyte.com/pubapi/v2/groups/{group_id}"
-
-        headers = CaseInsensitiveDict()
-        headers["Authorization"] = f"Bearer {egnyte_token}"
-        headers["Content-Type"] = "application/json"
-
-        data = '{"members":[{"value":'+ str(user_id) + '}]}'
-
-        group_change_resp = requests.patch(url, headers=headers, data=data)
-        group_change_dict = self.return_dict_from_api_resp(group_change_resp, 'group_change_dict')
+        self.add_group_members_api([user_id], group_id)
+    def add_group_members_api(self, user_ids:list, group_id:int) -> dict:
+        '''adds users to a particular permission group (PATCH only adds, existing members stay)'''
+        data = json.dumps({"members": [{"value": user_id} for user_id in user_ids]})
+
+        group_change_resp = self.api_request("PATCH", f"/v2/groups/{group_id}", data=data)
+        return self.return_dict_from_api_resp(group_change_resp, 'group_change_dict')
+    def set_group_members_api(self, user_ids:list, group_id:int, display_name:str) -> dict:
+        '''replaces the members of a permission group with exactly user_ids (PUT is a full update, so the name is resent)'''
+        data = json.dumps({"displayName": display_name, "members": [{"value": user_id} for user_id in user_ids]})
+
+        group_change_resp = self.api_request("PUT", f"/v2/groups/{group_id}", data=data)
+        return self.return_dict_from_api_resp(group_change_resp, 'group_change_dict')
         #endregion
     #endregion
 
+class TemplateCopier():
+    '''
+    Runs template copies (copy_folders_to_new_location) in the background, max_workers at a time, so provisioning moves
+    on to the rest of the row (and other rows) right after submit().
+    A copy request that times out is usually still running on egnyte's side, so its completion is then polled
+    (destination has every folder and file of the template, see copy_landed) for up to eg_config "copy_timeout" seconds.
+    A job's on_done runs once its copy landed (main.py posts the egnyte link from it). wait() blocks until every
+    copy finished and logs the duration + status of each.
+    '''
+    def __init__(self, client:EgnyteClient, max_workers:int=2):
+        self.client = client
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="eg-copy")
+        self.jobs = []
+        self.futures = []
+        self.lock = threading.Lock()
+
+    def submit(self, source_path:str, destination_path:str, on_done:Optional[Callable]=None) -> CopyJob:
+        job = CopyJob(source_path=source_path, destination_path=destination_path, submitted_at=time.monotonic(), on_done=on_done)
+        with self.lock:
+            self.jobs.append(job)
+            # propagate keeps the SAAS row / phase tags on the copy's calls
+            self.futures.append(self.executor.submit(propagate(self.run_copy), job))
+        logger.info(f"template copy to {destination_path} submitted")
+        return job
+    def run_copy(self, job:CopyJob):
+        try:
+            try:
+                self.client.copy_folders_to_new_location(job.source_path, job.destination_path)
+            except requests.exceptions.Timeout:
+                logger.info(f"template copy to {job.destination_path} is still running on egnyte's side, polling for it")
+                self.client.poll_until(
+                    lambda: self.client.copy_landed(job.source_path, job.destination_path),
+                    f"template copy to {job.destination_path}", timeout=eg_config.get("copy_timeout", 1800), max_interval=30)
+            if job.on_done is not None:
+                job.on_done(job)
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.error(f"template copy to {job.destination_path} failed: {e}")
+        finally:
+            job.finished_at = time.monotonic()
+    def wait(self) -> List[CopyJob]:
+        '''waits for every submitted copy, logs one line per copy and returns them'''
+        with self.lock:
+            futures = list(self.futures)
+        wait(futures)
+        with self.lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            log = logger.info if job.status == "done" else logger.error
+            log(f"template copy to {job.destination_path}: {job.status} in {job.duration_s:.1f}s" + (f" ({job.error})" if job.error else ""))
+        return jobs
+
 
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -1,13 +1,25 @@
 #!/usr/bin/env python
 
 import smartsheet
-import pandas as pd
+# pandas is imported inside the methods that build dfs, it is most of the cost of importing grid (and main.py)
 import datetime
 from datetime import date
 import time
 import math
 from pathlib import Path
 import json
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from clients.rate_limiter import mount_rate_limiter, wrap_with_rate_limiter
+from clients.instrumentation import propagate
+
+def json_default(value):
+    '''json.dumps default for row values: numpy scalars (values taken from a df) become the python number/bool they hold,
+    anything else json can't write (dates, timestamps) becomes its str'''
+    if getattr(value, "shape", None) == () and callable(getattr(value, "item", None)):
+        return value.item()
+    return str(value)
 
 class grid:
     """
@@ -29,14 +41,30 @@ class grid:
         ID of an existing Smartsheet sheet.
     grid_content : dict, optional
         Content of the sheet fetched from Smartsheet as a dictionary.
+    column_titles : list, optional
+        Column titles to fetch (projection applied server-side via columnIds), None fetches every column.
+    row_ids : list, optional
+        Row ids to fetch (applied server-side via rowIds), None fetches every row.
+    key_columns : list, optional
+        Column titles to index on fetch (value -> row ids), see find_row_ids(). Values seen on more than one row are listed in duplicate_keys.
 
     Methods:
     --------
+    get_row(row_id: int) -> Series:
+        Returns the df row for a row id (None if it is not on the sheet) using the row id index.
+
+    find_row_ids(column: str, value: Any) -> List[int]:
+        Returns the ids of the rows whose key column equals value using the key column index.
+
     get_column_df() -> DataFrame:
         Returns a DataFrame with details about the columns, such as title, type, options, etc.
 
-    fetch_content() -> None:
+    load_column_schema(force: bool=False) -> DataFrame:
+        Cached get_column_df() (also sets column_title_to_id / column_id_to_title), only refetched when the column schema may have changed.
+
+    fetch_content(delta: bool=False) -> None:
         Fetches the sheet content from Smartsheet and sets various attributes like columns, rows, row IDs, etc.
+        With delta=True and a previous fetch, only rows modified since then are pulled and patched into df.
 
     fetch_summary_content() -> None:
         Fetches and constructs a summary DataFrame for summary columns.
@@ -47,14 +75,18 @@ class grid:
     grab_posting_column_ids(filtered_column_title_list: Union[str, List[str]]="all_columns") -> None:
         Prepares a dictionary for column IDs based on their titles. Used internally for posting new rows.
 
-    delete_all_rows() -> None:
-        Deletes all rows in the current sheet.
+    delete_all_rows(max_in_flight: int=4) -> int:
+        Deletes all rows in the current sheet (row ids only fetch, then concurrent batched deletes), returns how many were deleted.
 
-    post_new_rows(posting_data: List[Dict[str, Any]], post_fresh: bool=False, post_to_top: bool=False) -> None:
+    post_new_rows(posting_data: Iterable[Dict[str, Any]], post_fresh: bool=False, post_to_top: bool=False, max_in_flight: int=1) -> None:
         Posts new rows to the Smartsheet. Can optionally delete the whole sheet before posting or set the position of the new rows.
 
-    update_rows(posting_data: List[Dict[str, Any]], primary_key: str):
-        Updates rows that can be updated, posts rows that do not map to the sheet.
+    update_rows(posting_data: List[Dict[str, Any]], primary_key: str, update_type: str='default', max_in_flight: int=1, diff: bool=False) -> Dict[str, int]:
+        Updates rows that can be updated, posts rows that do not map to the sheet. diff=True only sends cells that changed.
+
+    write_rows(method: str, rows: Iterable[Dict[str, Any]], max_in_flight: int=1, max_rows: int=None, to_top: bool=False) -> List[Dict[str, Any]]:
+        Streams api row dicts to the sheet in chunks bounded by row count and payload size, returns per-chunk timing. Used by post_new_rows and update_rows.
+        to_top=True adds the rows on top of the sheet in the order given (chunks are then sent one at a time).
 
     grab_posting_row_ids(posting_data: List[Dict[str, Any]], primary_key: str):
         returns a new posting_data called update_data that is a dictionary whose key is the row id, and whose value is the dictionary for the row <column name>:<field value>
@@ -67,22 +99,76 @@ class grid:
     """
 
     token = None
+    api_url = "https://api.smartsheet.com/2.0"
+
+    # smartsheet request limits used to size write_rows chunks
+    max_rows_per_request = 500
+    max_request_bytes = 1_000_000
+    # row ids go in the delete url, this keeps it well under the url length limit
+    max_row_ids_per_delete = 400
+    # a sheet that is busy with another write answers 409, those writes (deletes, row posts/updates) are retried this many times
+    busy_retries = 5
+
+    # seconds subtracted from the last fetch time when asking for modified rows, covers clock skew with smartsheet
+    delta_overlap = 60
 
-    def __init__(self, grid_id):
+    def __init__(self, grid_id, column_titles=None, row_ids=None, key_columns=None):
         self.grid_id = grid_id
+        self.column_titles = column_titles
+        self.row_ids = row_ids
+        self.key_columns = key_columns or []
+        self.row_positions = {}
+        self.key_indexes = {}
+        self.duplicate_keys = {}
+        self.projected_column_ids = None
+        self.missing_column_titles = []
         self.grid_content = None
+        self.grid_version = None
+        self.fetched_at = None
+        self.full_fetched_at = None
+        # set by refresh_delta when it gave up because the columns changed, the full fetch then reloads the schema first
+        self.columns_changed = False
+        # {(row_id, column_id): value} for the cells whose raw value is not what df shows (dates, currency, contacts, ...)
+        self.raw_values = {}
+        self.column_df = None
+        self.column_title_to_id = {}
+        self.column_id_to_title = {}
+        self.schema_version = None
         self.token = self.token
         if self.token == None:
             return "MUST SET TOKEN"
         else:
             self.smart = smartsheet.Smartsheet(access_token=self.token)
             self.smart.errors_as_exceptions(True)
+            # sdk calls and raw calls share the smartsheet token bucket (the sdk keeps its adapter and its own 429 retries)
+            wrap_with_rate_limiter(self.smart._session)
+            self.session = mount_rate_limiter(requests.Session())
+            self.session.headers.update({"Authorization": f"Bearer {self.token}"})
 #region core get requests   
+    def get_sheet_json(self, **params):
+        '''raw GET /sheets/{id} payload as a dict, skips the sdk's model objects and their .to_dict() deep copy'''
+        resp = self.session.get(f"{self.api_url}/sheets/{self.grid_id}", params=params)
+        resp.raise_for_status()
+        return resp.json()
+    def resolve_projection(self):
+        '''turns column_titles into column ids using the column schema, titles not on this sheet are skipped and kept in missing_column_titles'''
+        title_to_id = self.column_title_to_id
+        self.projected_column_ids = [title_to_id[title] for title in self.column_titles if title in title_to_id]
+        self.missing_column_titles = [title for title in self.column_titles if title not in title_to_id]
+    def sheet_params(self):
+        '''query params that apply the column projection / row filter server side'''
+        params = {}
+        if self.projected_column_ids is not None:
+            params["columnIds"] = ",".join(str(column_id) for column_id in self.projected_column_ids)
+        if self.row_ids is not None:
+            params["rowIds"] = ",".join(str(row_id) for row_id in self.row_ids)
+        return params
     def get_column_df(self):
         '''returns a df with data on the columns: title, type, options, etc...'''
         if self.token == None:
             return "MUST SET TOKEN"
         else:
+            import pandas as pd
             return pd.DataFrame.from_dict(
                 (self.smart.Sheets.get_columns(
                     self.grid_id, 
@@ -90,45 +176,184 @@ class grid:
                     include='objectValue', 
                     include_all=True)
                 ).to_dict().get("data"))
-    def fetch_content(self):
+    def load_column_schema(self, force=False):
+        '''column_df from the schema cache, the columns request only happens when the cache was loaded at an older sheet version
+        (fetches that find the same columns move the cache forward, so in practice that is once per sheet)'''
+        if force or self.column_df is None or self.schema_version != self.grid_version:
+            self.column_df = self.get_column_df()
+            self.column_title_to_id = dict(zip(self.column_df['title'], self.column_df['id']))
+            self.column_id_to_title = dict(zip(self.column_df['id'], self.column_df['title']))
+            self.schema_version = self.grid_version
+        return self.column_df
+    def schema_matches(self, columns):
+        '''True if the column dicts of a sheet response agree with the cached schema
+        (for a projected grid: the response has exactly the projected column ids, so a deleted or re-created column shows up)'''
+        if self.column_df is None:
+            return False
+        if self.projected_column_ids is None and len(columns) != len(self.column_id_to_title):
+            return False
+        if self.projected_column_ids is not None and {i.get("id") for i in columns} != set(self.projected_column_ids):
+            return False
+        return all(self.column_id_to_title.get(i.get("id")) == i.get("title") for i in columns)
+    def fetch_content(self, delta=False):
         '''this fetches data, ask coby why this is seperated
-        when this is done, there are now new objects created for various scenarios-- column_ids, row_ids, and the main sheet df'''
+        when this is done, there are now new objects created for various scenarios-- column_ids, row_ids, and the main sheet df
+        delta=True reuses the last fetch and only pulls rows modified since (falls back to a full fetch when the columns changed or rows were deleted)'''
+        self.columns_changed = False
         if self.token == None:
             return "MUST SET TOKEN"
+        elif delta and self.grid_version is not None and self.refresh_delta():
+            return
         else:
-            self.grid_content = (self.smart.Sheets.get_sheet(self.grid_id)).to_dict()
+            # the cached schema is still at a matching version when the delta found new columns, so it has to be forced
+            self.fetch_full(force_schema=self.columns_changed)
+    def fetch_full(self, force_schema=False):
+        '''the full fetch behind fetch_content, when the response shows the schema (and with it the projection) was stale,
+        the schema is reloaded and a projection that changed is fetched once more with the new column ids'''
+        for attempt in range(2):
+            if self.column_titles is not None:
+                self.load_column_schema(force=force_schema)
+                self.resolve_projection()
+            fetched_at = datetime.datetime.now(datetime.timezone.utc)
+            self.grid_content = self.get_sheet_json(**self.sheet_params())
+            self.grid_version = self.grid_content.get("version")
+            self.fetched_at = fetched_at
+            # delta fetches move fetched_at on, this one only moves with a full fetch (SheetCache's max snapshot age)
+            self.full_fetched_at = fetched_at
             self.grid_name = (self.grid_content).get("name")
             self.grid_url = (self.grid_content).get("permalink")
             # this attributes pulls the column headers
             self.grid_columns = [i.get("title") for i in (self.grid_content).get("columns")]
-            # note that the grid_rows is equivelant to the cell's 'Display Value'
-            self.grid_rows = []
-            if (self.grid_content).get("rows") == None:
-                self.grid_rows = []
-            else:
-                for i in (self.grid_content).get("rows"):
-                    b = i.get("cells")
-                    c = []
-                    for i in b:
-                        l = i.get("displayValue")
-                        m = i.get("value")
-                        if l == None:
-                            c.append(m)
-                        else:
-                            c.append(l)
-                    (self.grid_rows).append(c)
-            
-            # resulting fetched content
-            self.grid_rows = self.grid_rows
-            if (self.grid_content).get("rows") == None:
-                self.grid_row_ids = []
-            else:
-                self.grid_row_ids = [i.get("id") for i in (self.grid_content).get("rows")]
             self.grid_column_ids = [i.get("id") for i in (self.grid_content).get("columns")]
-            self.df = pd.DataFrame(self.grid_rows, columns=self.grid_columns)
-            # Should be row_id intead of id as that is less likely to be taken name space!!!
-            self.df["id"]=self.grid_row_ids
-            self.column_df = self.get_column_df()
+            rows = (self.grid_content).get("rows") or []
+            self.grid_row_ids = [i.get("id") for i in rows]
+            self.raw_values = {}
+            self.df = self.build_df(rows)
+            self.build_indexes()
+            if self.schema_matches((self.grid_content).get("columns")):
+                self.schema_version = self.grid_version
+                return
+            projected_column_ids = self.projected_column_ids
+            self.load_column_schema(force=True)
+            if self.column_titles is None:
+                return
+            self.resolve_projection()
+            if self.projected_column_ids == projected_column_ids:
+                return
+            # the schema is fresh now, the second pass only refetches the rows
+            force_schema = False
+    def build_df(self, rows):
+        '''builds the sheet df column by column straight from the raw row dicts (one array per column id, no per-row lists)
+        note that the values are equivelant to the cell's 'Display Value' (falls back to 'value'), the raw values that differ go in raw_values'''
+        columns = {column_id: [None] * len(rows) for column_id in self.grid_column_ids}
+        for position, row in enumerate(rows):
+            for cell in row.get("cells"):
+                value = cell.get("displayValue")
+                if value is None:
+                    value = cell.get("value")
+                elif value != cell.get("value"):
+                    self.raw_values[(row.get("id"), cell.get("columnId"))] = cell.get("value")
+                columns[cell.get("columnId")][position] = value
+        import pandas as pd
+        # object dtype keeps the cell values as smartsheet sent them (and lets refresh_delta patch any value in)
+        df = pd.DataFrame(
+            dict(zip(range(len(self.grid_column_ids)), (columns[column_id] for column_id in self.grid_column_ids))),
+            dtype=object)
+        df.columns = self.grid_columns
+        # Should be row_id intead of id as that is less likely to be taken name space!!!
+        df["id"] = [row.get("id") for row in rows]
+        return df
+    def row_values(self, row):
+        '''cell values of one row dict in grid_column_ids order, 'displayValue' wins over 'value' (the row's raw_values are replaced too)'''
+        values = {}
+        for column_id in self.grid_column_ids:
+            self.raw_values.pop((row.get("id"), column_id), None)
+        for cell in row.get("cells"):
+            value = cell.get("displayValue")
+            if value is not None and value != cell.get("value"):
+                self.raw_values[(row.get("id"), cell.get("columnId"))] = cell.get("value")
+            values[cell.get("columnId")] = cell.get("value") if value is None else value
+        return [values.get(column_id) for column_id in self.grid_column_ids]
+    def raw_value(self, row_id, column_id, shown_value):
+        '''the cell's 'value' (what the api takes back), shown_value is its df value'''
+        return self.raw_values.get((row_id, int(column_id)), shown_value)
+    def refresh_delta(self):
+        '''patches self.df with the rows modified since the last fetch
+        returns False when the caller has to do a full fetch instead (column schema changed or rows were deleted)'''
+        version = self.smart.Sheets.get_sheet_version(self.grid_id).version
+        if version == self.grid_version:
+            return True
+        if self.row_ids is not None:
+            # totalRowCount ignores the row filter, so deletions can't be spotted; filtered fetches are small anyway
+            return False
+
+        fetched_at = datetime.datetime.now(datetime.timezone.utc)
+        since = self.fetched_at - datetime.timedelta(seconds=self.delta_overlap)
+        delta_content = self.get_sheet_json(rowsModifiedSince=since.isoformat(timespec='seconds'), **self.sheet_params())
+
+        columns = delta_content.get("columns")
+        if [i.get("id") for i in columns] != self.grid_column_ids or [i.get("title") for i in columns] != self.grid_columns:
+            self.columns_changed = True
+            return False
+
+        value_columns = list(range(len(self.grid_columns)))
+        new_rows = []
+        for row in delta_content.get("rows") or []:
+            if row.get("id") in self.row_positions:
+                self.df.iloc[self.row_positions[row.get("id")], value_columns] = self.row_values(row)
+            else:
+                new_rows.append(row)
+        if new_rows:
+            import pandas as pd
+            self.df = pd.concat([self.df, self.build_df(new_rows)], ignore_index=True)
+
+        # rows_modified_since does not report deletions, a count mismatch means something was removed
+        if len(self.df) != delta_content.get("totalRowCount"):
+            return False
+
+        self.grid_row_ids = self.df['id'].tolist()
+        self.build_indexes()
+        self.grid_version = delta_content.get("version")
+        # same columns as before, so the cached schema is still good at this version
+        if self.column_df is not None:
+            self.schema_version = self.grid_version
+        self.fetched_at = fetched_at
+        return True
+    snapshot_attributes = [
+        'column_titles', 'row_ids', 'key_columns', 'projected_column_ids', 'missing_column_titles',
+        'grid_version', 'fetched_at', 'full_fetched_at', 'grid_name', 'grid_url', 'grid_columns', 'grid_column_ids', 'grid_row_ids',
+        'df', 'raw_values', 'column_df', 'column_title_to_id', 'column_id_to_title', 'schema_version'
+    ]
+    def snapshot(self):
+        '''everything a fetch sets up, as a plain dict (used by SheetCache to persist grids between runs)'''
+        return {attribute: getattr(self, attribute, None) for attribute in self.snapshot_attributes}
+    def restore(self, snapshot):
+        '''loads a snapshot() back in, fetch_content(delta=True) then brings it up to the sheet's current version'''
+        for attribute in self.snapshot_attributes:
+            setattr(self, attribute, snapshot.get(attribute))
+        self.build_indexes()
+    def build_indexes(self):
+        '''row id -> df position, and per key column: value -> row ids (values on more than one row also go in duplicate_keys)'''
+        self.row_positions = {row_id: position for position, row_id in enumerate(self.df['id'])}
+        self.key_indexes = {}
+        self.duplicate_keys = {}
+        for column in self.key_columns:
+            if column not in self.df.columns:
+                continue
+            index = {}
+            for value, row_id in zip(self.df[column], self.df['id']):
+                index.setdefault(value, []).append(row_id)
+            self.key_indexes[column] = index
+            self.duplicate_keys[column] = {value: row_ids for value, row_ids in index.items() if len(row_ids) > 1}
+    def get_row(self, row_id):
+        '''the df row for row_id, None if it is not on the sheet'''
+        position = self.row_positions.get(row_id)
+        if position is None:
+            return None
+        return self.df.iloc[position]
+    def find_row_ids(self, column, value):
+        '''ids of the rows where column == value, column must be one of key_columns'''
+        return self.key_indexes[column].get(value, [])
     def fetch_summary_content(self):
         '''builds the summary df for summary columns'''
         if self.token == None:
@@ -151,6 +376,7 @@ class grid:
                 self.grid_row_ids = []
             else:
                 self.grid_row_ids = [i.get("id") for i in (self.grid_content).get("data")]
+            import pandas as pd
             self.df = pd.DataFrame(self.grid_rows, columns=self.summary_params)
 #endregion 
 #region helpers     
@@ -174,59 +400,134 @@ class grid:
         filtered column title list is a list of column title str to prep for posting (if you are not posting to all columns)
         [NOT USED INDEPENDENTLY, BUT USED INSIDE OF POST_NEW_ROWS]'''
 
-        column_df = self.get_column_df()
+        column_df = self.load_column_schema()
 
         if filtered_column_title_list == "all_columns":
             filtered_column_title_list = column_df['title'].tolist()
     
-        self.column_id_dict = {title: column_df.loc[column_df['title'] == title]['id'].tolist()[0] for title in filtered_column_title_list}
-    def delete_all_rows(self):
-        '''deletes up to 400 rows in 200 row chunks by grabbing row ids and deleting them one at a time in a for loop
+        self.column_id_dict = {title: self.column_title_to_id[title] for title in filtered_column_title_list}
+    def fetch_row_ids(self):
+        '''ids of every row on the sheet, fetched with a single column projected so (almost) no cell data comes back'''
+        self.load_column_schema()
+        content = self.get_sheet_json(columnIds=str(int(self.column_df['id'].iloc[0])))
+        return [row.get("id") for row in content.get("rows") or []]
+    def delete_all_rows(self, max_in_flight=4):
+        '''deletes every row on the sheet: grabs only the row ids, then deletes them max_row_ids_per_delete at a time
+        with up to max_in_flight delete requests running at once (429/503 are retried by the rate limiter, 409 "sheet busy" by busy_request)
+        returns the number of rows deleted
         [NOT USED INDEPENDENTLY, BUT USED INSIDE OF POST_NEW_ROWS]'''
-        self.fetch_content()
-
-        row_list_del = []
-        for rowid in self.df['id'].to_list():
-            row_list_del.append(rowid)
-            # Delete rows to sheet by chunks of 200
-            if len(row_list_del) > 199:
-                self.smart.Sheets.delete_rows(self.grid_id, row_list_del)
-                row_list_del = []
-        # Delete remaining rows
-        if len(row_list_del) > 0:
-            self.smart.Sheets.delete_rows(self.grid_id, row_list_del) 
-    def post_new_rows(self, posting_data, post_fresh = False, post_to_top=False):
+        row_ids = self.fetch_row_ids()
+
+        def delete_chunk(chunk):
+            self.busy_request(
+                "DELETE", f"{self.api_url}/sheets/{self.grid_id}/rows",
+                params={"ids": ",".join(str(row_id) for row_id in chunk), "ignoreRowsNotFound": "true"})
+            return len(chunk)
+
+        chunks = [row_ids[i:i + self.max_row_ids_per_delete] for i in range(0, len(row_ids), self.max_row_ids_per_delete)]
+        with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(chunks) or 1))) as executor:
+            deleted = sum(executor.map(propagate(delete_chunk), chunks))
+
+        # the local copy is now out of date, next fetch_content(delta=True) does a full fetch
+        if getattr(self, 'df', None) is not None:
+            self.df = self.df.iloc[0:0]
+            self.raw_values = {}
+            self.grid_row_ids = []
+            self.build_indexes()
+        # deleting rows does not touch the columns, so the schema cache stays usable
+        self.grid_version = None
+        self.schema_version = None
+        return deleted
+    def post_new_rows(self, posting_data, post_fresh = False, post_to_top=False, max_in_flight=1):
         '''posts new row to sheet, does not account for various column types at the moment
-        posting data is a list of dictionaries, one per row, where the key is the name of the column, and the value is the value you want to post
-        then this function creates a second dictionary holding each column's id, and then posts the data one dictionary at a time (each is a row)
+        posting data is a list (or any iterable) of dictionaries, one per row, where the key is the name of the column, and the value is the value you want to post
+        then this function creates a second dictionary holding each column's id, and then streams the rows to the sheet in chunks (see write_rows)
         post_to_top = the new row will appear on top, else it will appear on bottom
         post_fresh = first delete the whole sheet, then post (else it will just update existing sheet)
         TODO: if using post_to_top==False, I should really delete the empty rows in the sheet so it will properly post to bottom'''
         
-        posting_sheet_id = self.grid_id
-        column_title_list = list(posting_data[0].keys())
+        posting_data = iter(posting_data)
+        first_item = next(posting_data, None)
+        if first_item is None:
+            return
+        column_title_list = list(first_item.keys())
         try:
             self.grab_posting_column_ids(column_title_list)
-        except IndexError:
-            raise ValueError("Index Error reveals that your posting_data dictionary has key(s) that don't match the column names on the Smartsheet")
+        except KeyError:
+            raise ValueError("Key Error reveals that your posting_data dictionary has key(s) that don't match the column names on the Smartsheet")
         if post_fresh:
             self.delete_all_rows()
-        
-        rows = []
-
-        for item in posting_data:
-            row = smartsheet.models.Row()
-            row.to_top = post_to_top
-            row.to_bottom= not(post_to_top)
-            for key in self.column_id_dict:
-                if item.get(key) != None:     
-                    row.cells.append({
-                    'column_id': self.column_id_dict[key],
-                    'value': item[key]
-                    })
-            rows.append(row)
-
-        self.post_response = self.smart.Sheets.add_rows(posting_sheet_id, rows)
+
+        # toTop is placed by write_rows (each chunk has to go under the one before it), toBottom rows keep their order as is
+        location = {} if post_to_top else {"toBottom": True}
+        def new_rows():
+            for item in itertools.chain([first_item], posting_data):
+                yield {**location, "cells": [
+                    {"columnId": int(self.column_id_dict[key]), "value": item[key]}
+                    for key in self.column_id_dict if item.get(key) != None
+                ]}
+
+        self.post_response = self.write_rows("POST", new_rows(), max_in_flight=max_in_flight, to_top=post_to_top)
+    def busy_request(self, method, url, **kwargs):
+        '''session.request that retries 409 "sheet busy" answers up to busy_retries times (429/503 are the rate limiter's),
+        raises for any status that is still an error'''
+        for attempt in range(self.busy_retries + 1):
+            resp = self.session.request(method, url, **kwargs)
+            if resp.status_code != 409 or attempt == self.busy_retries:
+                break
+            time.sleep(min(30, 2 ** attempt))
+        resp.raise_for_status()
+        return resp
+    def write_rows(self, method, rows, max_in_flight=1, max_rows=None, to_top=False):
+        '''the one row writer: POST (add) or PUT (update) /sheets/{id}/rows
+        rows is an iterator of api row dicts, they are pulled and sent in chunks that stay under max_rows_per_request and max_request_bytes,
+        (or max_rows rows), with up to max_in_flight chunks being sent at once, so memory stays flat no matter how many rows come through
+        to_top=True (POST, rows without a location) keeps the given order on top of the sheet: the first chunk goes toTop and every
+        later chunk goes right under the last row of the chunk before it (siblingId), so the chunks are sent one at a time
+        returns a report per chunk: {'chunk', 'rows', 'bytes', 'seconds'}'''
+        # siblingId of the last row added, for to_top
+        anchor = None
+        def send(chunk_number, chunk):
+            nonlocal anchor
+            if to_top:
+                location = json.dumps({"toTop": True} if anchor is None else {"siblingId": anchor})
+                chunk = [location[:-1] + "," + row_json[1:] for row_json in chunk]
+            body = "[" + ",".join(chunk) + "]"
+            started = time.perf_counter()
+            resp = self.busy_request(
+                method, f"{self.api_url}/sheets/{self.grid_id}/rows",
+                data=body.encode("utf-8"), headers={"Content-Type": "application/json"})
+            seconds = time.perf_counter() - started
+            if to_top:
+                anchor = resp.json()["result"][-1]["id"]
+            return {"chunk": chunk_number, "rows": len(chunk), "bytes": len(body), "seconds": seconds}
+
+        if to_top:
+            max_in_flight = 1
+        max_rows = max_rows or self.max_rows_per_request
+        # room for the location write_rows adds to each row ('"siblingId": <19 digits>,')
+        location_bytes = 40 if to_top else 0
+        report = []
+        in_flight = []
+        with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as executor:
+            def submit(chunk):
+                if len(in_flight) >= max(1, max_in_flight):
+                    report.append(in_flight.pop(0).result())
+                in_flight.append(executor.submit(propagate(send), len(report) + len(in_flight) + 1, chunk))
+
+            chunk, chunk_bytes = [], 2
+            for row in rows:
+                row_json = json.dumps(row, default=json_default)
+                row_bytes = len(row_json) + 1 + location_bytes
+                if chunk and (len(chunk) >= max_rows or chunk_bytes + row_bytes > self.max_request_bytes):
+                    submit(chunk)
+                    chunk, chunk_bytes = [], 2
+                chunk.append(row_json)
+                chunk_bytes += row_bytes
+            if chunk:
+                submit(chunk)
+            report.extend(future.result() for future in in_flight)
+        return report
     #endregion
     #region post timestamp
     def handle_update_stamps(self):
@@ -291,7 +592,7 @@ class grid:
         3. Return a dictionary: keys are row_ids (or "new_rows" for unmatched rows), values are the corresponding `posting_data` for each row.
         '''
 
-        self.fetch_content()
+        self.fetch_content(delta=True)
 
         if not self.df.empty:
             # Mapping of the primary key values to their corresponding row IDs from the current Smartsheet data
@@ -319,124 +620,82 @@ class grid:
             return update_data
         else:
             raise ValueError("Grid Instance is not appropriate for this task. Try create a new grid instance")
-    def update_rows(self, posting_data, primary_key, update_type='default'):
+    def cell_changed(self, current, new):
+        '''compares a cell's raw value (see raw_value) with an incoming value, both as text so 5, 5.0 and "5" count as the same,
+        dates/datetimes as their iso string (how smartsheet returns them) and contacts ({"email": ...} or an email) by email, ignoring case'''
+        def as_text(value):
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                return ""
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            if isinstance(value, dict) and "email" in value:
+                value = value["email"]
+            if isinstance(value, datetime.datetime):
+                if value.tzinfo is not None:
+                    return value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                value = value.date() if value.time() == datetime.time() else value
+            if isinstance(value, date):
+                return value.isoformat()
+            if isinstance(value, str) and "@" in value and " " not in value.strip():
+                return value.strip().lower()
+            return str(value)
+        return as_text(current) != as_text(new)
+    def update_rows(self, posting_data, primary_key, update_type='default', max_in_flight=1, diff=False):
         '''
         Updates rows (and adds misc rows) in the Smartsheet based on the provided posting data.  
 
         Parameters:
         - posting_data (list of dicts)
         - primary_key (string which is equal to a key of one of the items in all dictionaries)
+        - update_type ('default' streams the rows in full size chunks, 'debug' sends one row per request so a bad row is easy to spot)
+        - max_in_flight (how many chunks can be sent at the same time)
+        - diff (compares against the freshly fetched df and only sends cells whose value changed, rows with no changes are skipped
+            and missing/None values are left alone instead of being blanked out)
 
         Returns:
-        None. Updates and possibly adds rows in the Smartsheet.
+        dict of row counts {'changed', 'unchanged', 'new', 'cells'} (also kept in self.update_report). 
+        Updates and possibly adds rows in the Smartsheet (self.update_response holds the per-chunk report).
         '''
-        posting_sheet_id = self.grid_id
         column_title_list = list(posting_data[0].keys())
         try:
             self.grab_posting_column_ids(column_title_list)
-        except IndexError:
-            raise ValueError("Index Error reveals that your posting_data dictionary has key(s) that don't match the column names on the Smartsheet")
+        except KeyError:
+            raise ValueError("Key Error reveals that your posting_data dictionary has key(s) that don't match the column names on the Smartsheet")
         self.update_data = self.grab_posting_row_ids(posting_data, primary_key)
-
-        if update_type =='debug':
-            # Handle existing rows' updates (printing each row)
-            for i, row_id in enumerate(self.update_data.keys()):
-                if row_id != "new_rows":
-                    # Build the row to update
-                    new_row = smartsheet.models.Row()
-                    new_row.id = row_id
-                    for column_name in self.column_id_dict.keys():
-                        # does not post repost primary key
-                        if column_name != primary_key:
-                            # Build new cell value
-                            new_cell = smartsheet.models.Cell()
-                            new_cell.column_id = int(self.column_id_dict[column_name])
-                            # stops error where post doesnt go through because value is "None"
-                            if self.update_data[row_id].get(column_name) != None:
-                                print(f"{i+1}/{len(self.update_data.keys())}  ", self.update_data[row_id].get(column_name))
-                                new_cell.value = self.update_data[row_id].get(column_name)
-                            else:
-                                new_cell.value = ""
-                            new_cell.strict = False
-                            new_row.cells.append(new_cell)
-
-                    # Update rows
-                    self.update_response = self.smart.Sheets.update_rows(
-                      posting_sheet_id ,      # sheet_id
-                      [new_row])
-                    
-        elif update_type == 'batch':
-            rows = []
-            counter = 1
-            batch_total = int(math.ceil(len(self.update_data.keys()) / 350))
-            self.update_response = []       
-
-            for i, row_id in enumerate(self.update_data.keys()):
-                if row_id != "new_rows":
-                    new_row = smartsheet.models.Row()
-                    new_row.id = row_id
-                    for column_name in self.column_id_dict.keys():
-                        if column_name != primary_key:
-                            new_cell = smartsheet.models.Cell()
-                            new_cell.column_id = int(self.column_id_dict[column_name])
-                            new_cell.value = self.update_data[row_id].get(column_name, "")  # Use get method to handle None
-                            new_cell.strict = False
-                            new_row.cells.append(new_cell)
-                    rows.append(new_row)  # Properly add the new_row to the rows list       
-
-                # When 350 rows are collected or at the end of the data
-                if (i + 1) % 350 == 0 or (i + 1) == len(self.update_data.keys()):
-                    # Send the batch update
-                    self.update_response.append(self.smart.Sheets.update_rows(
-                        posting_sheet_id,
-                        rows  # Now passing the entire list of rows
-                    ))
-                    print(f"Batch {counter}/{batch_total}: updated {i + 1}/{len(self.update_data.keys())} in smartsheet")
-                    time.sleep(2)  # Optional: sleep to avoid hitting rate limits or as needed
-                    counter += 1
-                    rows = []  # Reset the rows list for the next batch     
-
-            # After the loop, check if there's any leftover rows to update
-            if rows:
-                self.update_response.append(self.smart.Sheets.update_rows(
-                    posting_sheet_id,
-                    rows
-                ))
-                print(f"Final batch: updated remaining {len(rows)} rows in smartsheet")
-
-        
-        elif update_type == 'default':
-            rows = []
-            # Handle existing rows' updates
-            for row_id in self.update_data.keys():
-                if row_id != "new_rows":
-                    # Build the row to update
-                    new_row = smartsheet.models.Row()
-                    new_row.id = row_id
-                    for column_name in self.column_id_dict.keys():
-                        # does not post repost primary key
-                        if column_name != primary_key:
-                            # Build new cell value
-                            new_cell = smartsheet.models.Cell()
-                            new_cell.column_id = int(self.column_id_dict[column_name])
-                            # stops error where post doesnt go through because value is "None"
-                            if self.update_data[row_id].get(column_name) != None:
-                                new_cell.value = self.update_data[row_id].get(column_name)
-                            else:
-                                new_cell.value = ""
-                            new_cell.strict = False
-                            new_row.cells.append(new_cell)
-                    rows.append(new_row)
-
-            # Update rows
-            self.update_response = self.smart.Sheets.update_rows(
-              posting_sheet_id ,      # sheet_id
-              rows)
-
-        try:
-            # Handle addition of new rows if the "new_rows" key is present
-            self.post_new_rows(self.update_data.get('new_rows'))
-        except TypeError:
-            pass
+        self.update_report = {"changed": 0, "unchanged": 0, "new": len(self.update_data.get('new_rows', [])), "cells": 0}
+
+        def updated_rows():
+            for row_id, data in self.update_data.items():
+                if row_id == "new_rows":
+                    continue
+                current_row = self.get_row(row_id) if diff else None
+                cells = []
+                for column_name, column_id in self.column_id_dict.items():
+                    # does not post repost primary key
+                    if column_name == primary_key:
+                        continue
+                    value = data.get(column_name)
+                    if diff:
+                        if value == None:
+                            continue
+                        if current_row is not None and column_name in current_row.index and not self.cell_changed(
+                                self.raw_value(row_id, column_id, current_row[column_name]), value):
+                            continue
+                    # stops error where post doesnt go through because value is "None"
+                    cells.append({"columnId": int(column_id), "value": value if value != None else "", "strict": False})
+                if not cells:
+                    self.update_report["unchanged"] += 1
+                    continue
+                self.update_report["changed"] += 1
+                self.update_report["cells"] += len(cells)
+                yield {"id": int(row_id), "cells": cells}
+
+        self.update_response = self.write_rows(
+            "PUT", updated_rows(), max_in_flight=max_in_flight, max_rows=1 if update_type == 'debug' else None)
+
+        # Handle addition of new rows if the "new_rows" key is present
+        if self.update_data.get('new_rows'):
+            self.post_new_rows(self.update_data.get('new_rows'), max_in_flight=max_in_flight)
+        return self.update_report
     #endregion
 #endregion
\ No newline at end of file
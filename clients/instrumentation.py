@@ -0,0 +1,123 @@
+#region imports and variables
+import re
+import json
+import math
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Optional
+from pathlib import Path
+import logging
+from configs.setup_logger import setup_logger
+logger = setup_logger(__name__, level=logging.DEBUG)
+
+# what the calls being made right now are for, set with tag() (main.py tags each SAAS row and phase)
+current_saas_row = contextvars.ContextVar("current_saas_row", default=None)
+current_phase = contextvars.ContextVar("current_phase", default=None)
+#endregion
+
+#region Models
+@dataclass
+class CallRecord:
+    host: str
+    method: str
+    endpoint: str
+    status: Optional[int]
+    bytes_out: int
+    bytes_in: int
+    seconds: float
+    retries: int
+    saas_row: Optional[int]
+    phase: Optional[str]
+#endregion
+
+@contextmanager
+def tag(saas_row=None, phase=None):
+    '''tags every outbound call made inside the block (and in threads started with propagate()) with a SAAS row and/or phase'''
+    tokens = []
+    if saas_row is not None:
+        tokens.append((current_saas_row, current_saas_row.set(saas_row)))
+    if phase is not None:
+        tokens.append((current_phase, current_phase.set(phase)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+def propagate(fn):
+    '''wraps fn so it runs with the caller's tags when handed to a thread pool'''
+    context = contextvars.copy_context()
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+def endpoint_from_path(path:str) -> str:
+    '''groups urls by endpoint: egnyte folder paths become {path}, numeric ids and uuids become {id}'''
+    path = path.split("?")[0]
+    path = re.sub(r"^(/pubapi/v1/fs/ids/folder|/pubapi/v1/fs|/pubapi/v2/perms)/.+$", r"\1/{path}", path)
+    path = re.sub(r"/[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}(?=/|$)", "/{id}", path)
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path)
+def percentile(values:list, pct:float) -> float:
+    '''nearest-rank percentile of a non-empty list'''
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+class CallRecorder():
+    '''collects a CallRecord for every outbound api call (fed by clients.rate_limiter.RateLimitedAdapter)'''
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+    def record(self, host:str, method:str, path:str, status:Optional[int], bytes_out:int, bytes_in:int, seconds:float, retries:int) -> CallRecord:
+        call = CallRecord(
+            host=host, method=method, endpoint=endpoint_from_path(path), status=status,
+            bytes_out=bytes_out, bytes_in=bytes_in, seconds=seconds, retries=retries,
+            saas_row=current_saas_row.get(), phase=current_phase.get())
+        with self.lock:
+            self.records.append(call)
+        return call
+    def update(self, call:CallRecord, **fields):
+        '''changes a recorded call in place (a retry folded into the call it retried)'''
+        with self.lock:
+            for name, value in fields.items():
+                setattr(call, name, value)
+    def summary(self) -> dict:
+        '''{"endpoints": {...}, "phases": {...}} with count, total/p50/p95/max seconds, bytes and retries per group'''
+        with self.lock:
+            records = list(self.records)
+        def stats(calls):
+            seconds = [call.seconds for call in calls]
+            return {
+                "count": len(calls),
+                "total_s": round(sum(seconds), 3),
+                "p50_s": round(percentile(seconds, 50), 3),
+                "p95_s": round(percentile(seconds, 95), 3),
+                "max_s": round(max(seconds), 3),
+                "bytes_in": sum(call.bytes_in for call in calls),
+                "bytes_out": sum(call.bytes_out for call in calls),
+                "retries": sum(call.retries for call in calls),
+            }
+        def group(key):
+            groups = {}
+            for call in records:
+                groups.setdefault(key(call), []).append(call)
+            return {name: stats(calls) for name, calls in sorted(groups.items(), key=lambda item: -sum(c.seconds for c in item[1]))}
+        return {
+            "endpoints": group(lambda call: f"{call.method} {call.host}{call.endpoint}"),
+            "phases": group(lambda call: call.phase or "untagged"),
+        }
+    def log_summary(self):
+        summary = self.summary()
+        for section in ("phases", "endpoints"):
+            logger.info(f"api timing by {section[:-1]}:")
+            for name, stats in summary[section].items():
+                logger.info(
+                    f"  {name}: {stats['count']} calls, total {stats['total_s']}s, p50 {stats['p50_s']}s, "
+                    f"p95 {stats['p95_s']}s, max {stats['max_s']}s, {stats['retries']} retries")
+    def export_json(self, path):
+        '''writes the summary + every raw call record, for trend tracking across runs'''
+        with self.lock:
+            records = [asdict(call) for call in self.records]
+        Path(path).write_text(json.dumps({"summary": self.summary(), "calls": records}, indent=2, default=str))
+
+recorder = CallRecorder()
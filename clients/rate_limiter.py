@@ -0,0 +1,186 @@
+#region imports and variables
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+import logging
+from clients.instrumentation import recorder
+from configs.setup_logger import setup_logger
+logger = setup_logger(__name__, level=logging.DEBUG)
+
+# (requests per second, burst) per api host, from each vendor's published limits:
+# smartsheet allows 300 requests/minute per token, egnyte's default plan allows 2 calls/second per token
+host_limits = {
+    "api.smartsheet.com": (5, 10),
+    "dowbuilt.egnyte.com": (2, 2),
+}
+retry_statuses = (429, 503)
+# what the smartsheet sdk resends on its own (rate limit, maintenance, server timeout / unexpected error)
+sdk_retry_statuses = (429, 500, 503)
+#endregion
+
+class TokenBucket():
+    '''classic token bucket, acquire() blocks until a token is free (reserve() is the non-blocking step, for async waiters)'''
+    def __init__(self, rate:float, capacity:int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        '''takes a token if one is free and returns 0, otherwise returns the seconds until the next one is'''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+    def acquire(self):
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            time.sleep(wait)
+class RateLimiter():
+    '''one token bucket per api host (shared by every client in the process) + retry policy for 429/503 responses'''
+    def __init__(self, limits:dict, max_retries:int=5, base_backoff:float=1, max_backoff:float=60):
+        self.limits = limits
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+        # None = the network, otherwise an object with send(network_send, request, **kwargs) that every adapter goes through
+        # (tools/replay.py records / replays calls this way)
+        self.transport = None
+
+    def bucket(self, host:str) -> Optional[TokenBucket]:
+        '''the host's token bucket, None for hosts without a configured limit (they are not throttled)'''
+        if host not in self.limits:
+            return None
+        with self.buckets_lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(*self.limits[host])
+            return self.buckets[host]
+    def acquire(self, host:str):
+        '''waits for a token for host'''
+        bucket = self.bucket(host)
+        if bucket is not None:
+            bucket.acquire()
+    async def acquire_async(self, host:str):
+        '''acquire() for coroutines (clients.eg_async_client), waits on the event loop instead of blocking its thread'''
+        bucket = self.bucket(host)
+        while bucket is not None:
+            wait = bucket.reserve()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+    def retry_delay(self, resp:requests.models.Response, attempt:int) -> float:
+        '''Retry-After when the server sends one, otherwise jittered exponential backoff'''
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                try:
+                    return max(0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+class RateLimitedAdapter(HTTPAdapter):
+    '''HTTPAdapter that takes a token before every request and (retry=True) retries 429/503 responses,
+    mounted on the sessions of grid and EgnyteClient. inner = an adapter to send through instead of this one's own pool
+    (the smartsheet sdk's adapter, which keeps its TLS settings and urllib3 Retry, see wrap_with_rate_limiter)
+    with retry=False the caller retries (the sdk), a resend of the last call on the same thread that got a sdk_retry_statuses
+    answer is folded into that call's CallRecord (retries + 1, latency from the first attempt) instead of being a call of its own'''
+    def __init__(self, limiter, inner:Optional[HTTPAdapter]=None, retry:bool=True, **kwargs):
+        self.limiter = limiter
+        self.inner = inner
+        self.retry = retry
+        # per thread: (method, url, started_at, CallRecord) of the last call that answered a status the caller may resend
+        self.retryable = threading.local()
+        super().__init__(**kwargs)
+
+    def network_send(self, request, **kwargs):
+        if self.inner is not None:
+            return self.inner.send(request, **kwargs)
+        return super().send(request, **kwargs)
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+        super().close()
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        host = url.hostname
+        attempt = 0
+        started_at = time.perf_counter()
+        retried = self.retried_call(request)
+        if retried is not None:
+            started_at, previous = retried
+            attempt = previous.retries + 1
+        while True:
+            self.limiter.acquire(host)
+            try:
+                transport = self.limiter.transport
+                resp = transport.send(self.network_send, request, **kwargs) if transport else self.network_send(request, **kwargs)
+            except requests.exceptions.RequestException:
+                self.record(request, url, None, 0, started_at, attempt, retried)
+                raise
+            if not self.retry or resp.status_code not in retry_statuses or attempt >= self.limiter.max_retries:
+                call = self.record(request, url, resp.status_code, self.response_bytes(resp, kwargs.get("stream")), started_at, attempt, retried)
+                if not self.retry and resp.status_code in sdk_retry_statuses:
+                    self.retryable.call = (request.method, request.url, started_at, call)
+                return resp
+            delay = self.limiter.retry_delay(resp, attempt)
+            logger.debug(f"{host} answered {resp.status_code}, retrying in {delay:.1f}s ({attempt + 1}/{self.limiter.max_retries})")
+            resp.close()
+            time.sleep(delay)
+            attempt += 1
+    def response_bytes(self, resp:requests.models.Response, stream) -> int:
+        '''Content-Length when sent, otherwise the body length (never reads a streamed body)'''
+        length = resp.headers.get("Content-Length")
+        if length and length.isdigit():
+            return int(length)
+        return 0 if stream else len(resp.content or b"")
+    def retried_call(self, request) -> Optional[tuple]:
+        '''(started_at, CallRecord) of the call this request resends (retry=False only), None for a new call'''
+        retryable, self.retryable.call = getattr(self.retryable, "call", None), None
+        if retryable is None or retryable[:2] != (request.method, request.url):
+            return None
+        return retryable[2:]
+    def record(self, request, url, status, bytes_in:int, started_at:float, retries:int, retried:Optional[tuple]=None):
+        '''one CallRecord per logical call, latency includes rate limit waits and retry backoff
+        retried = retried_call() of this request, its record is updated instead of adding one'''
+        seconds = time.perf_counter() - started_at
+        if retried is not None:
+            call = retried[1]
+            recorder.update(call, status=status, bytes_in=bytes_in, seconds=seconds, retries=retries)
+            return call
+        body = request.body or b""
+        return recorder.record(
+            host=url.hostname, method=request.method, path=url.path, status=status,
+            bytes_out=len(body.encode() if isinstance(body, str) else body) if isinstance(body, (str, bytes)) else 0,
+            bytes_in=bytes_in, seconds=seconds, retries=retries)
+
+rate_limiter = RateLimiter(host_limits)
+
+def mount_rate_limiter(session:requests.Session, pool_size:int=10) -> requests.Session:
+    '''mounts the shared rate limiter on a session (pool_size keeps the connection pooling the session would otherwise get)'''
+    session.mount("https://", RateLimitedAdapter(rate_limiter, pool_connections=pool_size, pool_maxsize=pool_size))
+    return session
+def wrap_with_rate_limiter(session:requests.Session) -> requests.Session:
+    '''puts the shared token bucket in front of the adapter a library already mounted (the smartsheet sdk's _SSLAdapter),
+    that adapter still does the sending and the library keeps its own 429 retry loop, so the limiter does not retry on top'''
+    inner = session.get_adapter("https://")
+    if not isinstance(inner, RateLimitedAdapter):
+        session.mount("https://", RateLimitedAdapter(rate_limiter, inner=inner, retry=False, pool_connections=1, pool_maxsize=1))
+    return session
@@ -0,0 +1,116 @@
+#region imports and variables
+import pickle
+import datetime
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import logging
+from clients.grid import grid
+from configs.setup_logger import setup_logger
+logger = setup_logger(__name__, level=logging.DEBUG)
+# bump whenever grid.snapshot() changes shape, older snapshot files are then ignored
+snapshot_version = 3
+#endregion
+
+class SheetCache():
+    '''
+    Two level cache of fetched grids, keyed by region (any region name works, there is no fixed list).
+
+    - memory: the grids of this run, least recently used ones are dropped once their dfs use more than memory_budget_mb
+    - disk (optional): a snapshot per sheet id (df + column schema + sheet version) in snapshot_dir, so the next run
+      restores it and only asks smartsheet for the version / rows modified since (grid.fetch_content(delta=True)).
+      Formula results can change without the sheet's version or the rows' modifiedAt moving, so a snapshot older than
+      max_age_hours (None = no limit) gets a full fetch instead, as does every get(..., full=True).
+    '''
+    def __init__(self, snapshot_dir=None, memory_budget_mb=512, max_age_hours=None):
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        self.max_age = datetime.timedelta(hours=max_age_hours) if max_age_hours is not None else None
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.sheets = OrderedDict()
+        self.sheet_sizes = {}
+        self.lock = threading.Lock()
+        self.region_locks = {}
+
+    def region_key(self, region:str) -> str:
+        '''normalizes the region name to handle special cases (e.g., M.T.N.)'''
+        return region.replace('.', '').upper()
+    def region_lock(self, key:str) -> threading.Lock:
+        with self.lock:
+            if key not in self.region_locks:
+                self.region_locks[key] = threading.Lock()
+            return self.region_locks[key]
+    def get(self, region:str, new_grid, full:bool=False) -> grid:
+        '''returns the fetched grid for region, new_grid() makes the (unfetched) grid when it is not in memory
+        full=True skips the disk snapshot (the first fetch of the run is a full one)'''
+        key = self.region_key(region)
+        with self.region_lock(key):
+            with self.lock:
+                sheet = self.sheets.get(key)
+                if sheet is not None:
+                    self.sheets.move_to_end(key)
+                    return sheet
+
+            sheet = new_grid()
+            self.load(sheet, region, full)
+            with self.lock:
+                self.sheets[key] = sheet
+                self.sheet_sizes[key] = int(sheet.df.memory_usage(deep=True).sum())
+                self.evict()
+        return sheet
+    def load(self, sheet:grid, region:str, full:bool=False):
+        '''restores the disk snapshot (version checked + delta patched by fetch_content) or does a full fetch'''
+        snapshot = None if full else self.read_snapshot(sheet)
+        if snapshot is not None:
+            sheet.restore(snapshot)
+            logger.info(f"Refreshing the {region} Smartsheet from its snapshot (version {sheet.grid_version})...")
+            sheet.fetch_content(delta=True)
+        else:
+            logger.info(f"Fetching the {region} Smartsheet...")
+            sheet.fetch_content()
+        if not full and (snapshot is None or snapshot.get("grid_version") != sheet.grid_version):
+            self.write_snapshot(sheet)
+    def evict(self):
+        '''drops least recently used grids until the cache fits memory_budget (the newest one always stays), must hold self.lock'''
+        while len(self.sheets) > 1 and sum(self.sheet_sizes.values()) > self.memory_budget:
+            key, _ = self.sheets.popitem(last=False)
+            logger.debug(f"sheet cache over budget, dropping {key} from memory")
+            del self.sheet_sizes[key]
+    def snapshot_path(self, sheet:grid) -> Path:
+        return self.snapshot_dir / f"{sheet.grid_id}.pkl"
+    def read_snapshot(self, sheet:grid):
+        '''the snapshot for this sheet id, None if disabled/missing/old format/made with a different column projection'''
+        if self.snapshot_dir is None:
+            return None
+        try:
+            with open(self.snapshot_path(sheet), "rb") as f:
+                snapshot = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        if snapshot.get("snapshot_version") != snapshot_version or snapshot.get("column_titles") != sheet.column_titles:
+            return None
+        if self.is_expired(snapshot):
+            logger.debug(f"sheet snapshot for {sheet.grid_id} is older than {self.max_age}, doing a full fetch")
+            return None
+        return snapshot
+    def is_expired(self, snapshot:dict) -> bool:
+        '''True when the snapshot's last full fetch is older than max_age (delta fetches never refresh formula results)'''
+        fetched_at = snapshot.get("full_fetched_at")
+        if self.max_age is None:
+            return False
+        if fetched_at is None:
+            return True
+        return datetime.datetime.now(datetime.timezone.utc) - fetched_at > self.max_age
+    def write_snapshot(self, sheet:grid):
+        if self.snapshot_dir is None:
+            return
+        snapshot = sheet.snapshot()
+        snapshot["snapshot_version"] = snapshot_version
+        path = self.snapshot_path(sheet)
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_path.replace(path)
+        except OSError as e:
+            logger.warning(f"could not write sheet snapshot for {sheet.grid_id}: {e}")
@@ -4,27 +4,39 @@ import os
 import sys
 import smartsheet
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from smartsheet.exceptions import ApiError
 import requests
 from requests.structures import CaseInsensitiveDict
 import json
 import re
-import pandas as pd
 from dataclasses import dataclass, field
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, TYPE_CHECKING
 from pathlib import Path
 import logging
 from clients.grid import grid
+from clients.sheet_cache import SheetCache
+from clients.write_buffer import RowWriteBuffer, RowWriteResult
+from clients.rate_limiter import wrap_with_rate_limiter
+from clients.instrumentation import propagate
+from configs.app_config import ss_config
+if TYPE_CHECKING:
+    import pandas as pd
 from configs.setup_logger import setup_logger
 logger = setup_logger(__name__, level=logging.DEBUG)
-ss_config = json.loads(Path("configs/ss_config.json").read_text())
-smartsheet_admin_token = ss_config["smartsheet_admin_token"]
-smart = smartsheet.Smartsheet(access_token=smartsheet_admin_token)
-smart.errors_as_exceptions(True)
-grid.token=smartsheet_admin_token
 #endregion
 
+def build_smartsheet_sdk() -> smartsheet.Smartsheet:
+    '''the sdk client behind SmartsheetClient, made when the first SmartsheetClient is (also hands the token to grid)'''
+    grid.token = ss_config["smartsheet_admin_token"]
+    smart = smartsheet.Smartsheet(access_token=grid.token)
+    smart.errors_as_exceptions(True)
+    # the sdk's own adapter (TLS settings) stays in place, the sdk's retry loop handles 429s
+    wrap_with_rate_limiter(smart._session)
+    return smart
+
 #region Models
 @dataclass
 class ProjectObj:
@@ -69,21 +81,33 @@ class PostingData:
 
 class SmartsheetClient():
     '''words'''
+    # the only columns build_proj_obj / identify_open_saas_rows read, fetched via grid's column projection
+    saas_columns = [
+        'ENUMERATOR', 'REGION', 'New Name', 'Saas Status', 'ADMINISTRATIVE Action Type',
+        'Update Conditional', 'SM Conditional', 'EGN Conditional'
+    ]
+    regional_columns = [
+        'ENUMERATOR', 'FULL NAME', 'REGION', 'STATE', 'JOB TYPE', 'SMARTSHEET', 'EGNYTE',
+        'PM', 'PE', 'SUP', 'FM', 'NON SYS Created By', "Platform Containers addt'l Permissions"
+    ]
     def __init__(self):
         logger.debug('Initializing Smartsheet Client...')
+        self.smart = build_smartsheet_sdk()
         self.ss_link = ""
-        self.cached_sheets = {
-            'SAAS':None,
-            'HI': None,
-            'NY': None,
-            'NORCAL': None,
-            'SOCAL': None,
-            'WA': None,
-            'FL': None,
-            'MTN': None,
-            'ATX': None,
-            'NE': None
-        }
+        # any region works, sheets are snapshotted to disk between runs (ss_config "sheet_snapshot_dir", "" to turn off)
+        # and fully refetched once a snapshot is older than ss_config "sheet_snapshot_max_age_hours" (null = never)
+        self.cached_sheets = SheetCache(
+            snapshot_dir=ss_config.get('sheet_snapshot_dir', 'configs/sheet_cache'),
+            memory_budget_mb=ss_config.get('sheet_cache_mb', 512),
+            max_age_hours=ss_config.get('sheet_snapshot_max_age_hours', 24))
+        # run-scoped workspace index (see find_wrkspc), built on first use
+        self.wrkspcs_by_permalink = None
+        self.wrkspcs_by_id = {}
+        self.wrkspcs_by_name = {}
+        self.wrkspc_index_misses = set()
+        self.wrkspc_index_lock = threading.Lock()
+        # link + checkbox posts are batched per sheet and sent by flush_posts() (or once a sheet has write_buffer_rows waiting)
+        self.write_buffer = RowWriteBuffer(self.smart, flush_threshold=ss_config.get('write_buffer_rows', 100))
 #region helpers
     def try_except_pattern(self, value:str) -> str:
         '''wraps "value" in a try/accept format. used when pulling  info from DF because blank columns are not added to df, so you must try/except each df inquiry'''
@@ -112,11 +136,11 @@ class SmartsheetClient():
             - The sheet ID string (used to grab highly specific email data from the regional sheet).
         """
         saas_sheet = self.handle_cached_smartsheets(region='SAAS', sheet_id=ss_config['saas_id'])
-        region = self.region_from_saas_rowid(saas_row_id, saas_sheet.df)
-        regional_sheet_id = ss_config['regional_sheetid_obj'][region]
+        region = self.region_from_saas_rowid(saas_row_id, saas_sheet)
+        regional_sheet_id = self.regional_sheet_id(region)
         regional_sheet = self.handle_cached_smartsheets(region, regional_sheet_id)
         return saas_sheet, regional_sheet, regional_sheet_id
-    def filter_to_relevent_row(self, saas_sheet: grid, regional_sheet: grid, enum:str, saas_row_id:str) -> tuple[pd.Series, pd.Series]:
+    def filter_to_relevent_row(self, saas_sheet: grid, regional_sheet: grid, enum:str, saas_row_id:str) -> tuple['pd.Series', 'pd.Series']:
         """
         Filteres the smartsheet data to the correct enunerator/sheet id so we have easy to use row data
 
@@ -131,17 +155,25 @@ class SmartsheetClient():
             - The project row DataFrame.
             - The SaaS row Series.
         """
-        
-        proj_row = regional_sheet.df.loc[regional_sheet.df['ENUMERATOR'] == enum].iloc[0]
-        if proj_row.empty:
-            logger.warning(f"No project data found for ENUMERATOR @ regional PL: {enum}")
 
-        saas_row = saas_sheet.df.loc[saas_sheet.df['id'] == saas_row_id].iloc[0]
-        if saas_row.empty:
+        proj_row = regional_sheet.get_row(self.regional_row_id_from_enum(regional_sheet, enum))
+
+        saas_row = saas_sheet.get_row(saas_row_id)
+        if saas_row is None:
             logger.warning(f"No project data found for ENUMERATOR @ saas admin: {enum}")
+            raise ValueError(f"saas row {saas_row_id} is not on the SAAS sheet")
 
         return proj_row, saas_row
-    def process_permission_users(self, proj_row:pd.Series):
+    def regional_row_id_from_enum(self, regional_sheet: grid, enum:str) -> int:
+        '''looks the enumerator up in the regional sheet's ENUMERATOR index, duplicates are reported and the first row is used'''
+        row_ids = regional_sheet.find_row_ids('ENUMERATOR', enum)
+        if not row_ids:
+            logger.warning(f"No project data found for ENUMERATOR @ regional PL: {enum}")
+            raise ValueError(f"ENUMERATOR {enum} is not on the regional Project List")
+        if len(row_ids) > 1:
+            logger.warning(f"ENUMERATOR {enum} is on {len(row_ids)} rows of the regional Project List ({row_ids}), using the first")
+        return row_ids[0]
+    def process_permission_users(self, proj_row:'pd.Series'):
         '''takes a df that is filtered to one specific enumerator that we need to grab info on 
         grabs users of all roles (from regional sheet), also looks at addtional permission users'''
         roles = ['PM', 'PE', 'SUP', 'FM', 'NON SYS Created By']
@@ -162,23 +194,26 @@ class SmartsheetClient():
         ]
 
         return users
-    def process_permission_emails(self, proj_row:pd.Series, regional_column_df:pd.DataFrame, sheet_id: str):
+    def process_permission_emails(self, proj_row:'pd.Series', regional_sheet:grid, sheet_id: str):
         '''Extracts and processes user emails from regional sheet'''
 
+        # copied so the shared config is not mutated per row
+        user_column_names = list(ss_config['user_column_names'])
         if proj_row["REGION"] == 'HI':
-            ss_config['user_column_names'].append("PRINCIPAL")
+            user_column_names.append("PRINCIPAL")
 
         user_column_ids = []
-        for column in ss_config['user_column_names']:
-            matching_rows = regional_column_df.loc[regional_column_df['title'] == column]
-            if matching_rows.empty:
+        regional_sheet.load_column_schema()
+        for column in user_column_names:
+            column_id = regional_sheet.column_title_to_id.get(column)
+            if column_id is None:
                 logger.debug(f"Column df for {proj_row['REGION']} did not return value for column '{column}'")
                 continue  # Skip this column if no match is found
-            user_column_ids.append(matching_rows['id'].iloc[0])
+            user_column_ids.append(column_id)
 
 
         # Fetch and process the reduced sheet data
-        reduced_sheet = smart.Sheets.get_sheet(
+        reduced_sheet = self.smart.Sheets.get_sheet(
             sheet_id,
             row_ids=proj_row['id'],
             column_ids=user_column_ids,
@@ -230,12 +265,12 @@ class SmartsheetClient():
         saas_sheet, regional_sheet, regional_sheet_id = self.get_relevent_smartsheets(saas_row_id)
 
         # Step 2: Filter to specific project and SaaS row
-        enum = saas_sheet.df.loc[saas_sheet.df['id'] == saas_row_id].iloc[0]['ENUMERATOR']
+        enum = saas_sheet.get_row(saas_row_id)['ENUMERATOR']
         proj_row, saas_row = self.filter_to_relevent_row(saas_sheet, regional_sheet, enum, saas_row_id)
 
         # Step 3: Process users and emails
         users = self.process_permission_users(proj_row)
-        user_emails = self.process_permission_emails(proj_row, regional_sheet.column_df, regional_sheet_id)
+        user_emails = self.process_permission_emails(proj_row, regional_sheet, regional_sheet_id)
 
         # Step 4: Create and return the ProjectObj
         project_obj = ProjectObj(
@@ -272,122 +307,186 @@ class SmartsheetClient():
             grid: The loaded or existing grid object for the specified region.
         """
 
-        # Normalize the region name to handle special cases (e.g., MTN)
-        obj_region = region.replace('.', '')
-
-        # Check if the DataFrame for the region is already loaded
-        sheet = self.cached_sheets[obj_region]
-
-        if sheet is None:
-            # Load the DataFrame (replace this with your actual loading logic)
-            logger.info(f"Fetching the {region} Smartsheet...")
-            sheet = grid(sheet_id)
-            sheet.fetch_content()
-            self.cached_sheets[obj_region] = sheet
-
+        def new_grid():
+            return grid(
+                sheet_id,
+                column_titles=self.saas_columns if self.cached_sheets.region_key(region) == 'SAAS' else self.regional_columns,
+                key_columns=['ENUMERATOR'])
+
+        # the SAAS sheet drives the whole run (its status/conditional columns are formulas), so it is never restored from a snapshot
+        sheet = self.cached_sheets.get(region, new_grid, full=self.cached_sheets.region_key(region) == 'SAAS')
+        if sheet.missing_column_titles:
+            logger.debug(f"{region} Smartsheet is missing columns: {sheet.missing_column_titles}")
+        if sheet.duplicate_keys.get('ENUMERATOR'):
+            logger.warning(f"{region} Smartsheet has duplicate ENUMERATORs: {list(sheet.duplicate_keys['ENUMERATOR'])}")
         return sheet
+    def regional_sheet_id(self, region: str) -> str:
+        '''sheet id of a region's Project List from ss_config "regional_sheetid_obj" (add new regions there, nothing else to change)'''
+        regional_sheet_ids = ss_config['regional_sheetid_obj']
+        if region in regional_sheet_ids:
+            return regional_sheet_ids[region]
+        for config_region, sheet_id in regional_sheet_ids.items():
+            if self.cached_sheets.region_key(config_region) == self.cached_sheets.region_key(region):
+                return sheet_id
+        raise ValueError(f"region {region} has no Project List in ss_config 'regional_sheetid_obj'")
 #endregion
 #region sheets
-    def region_from_saas_rowid(self, saas_row_id: int, saas_sheet_df:pd.DataFrame) -> str:
-        '''given an enumerator (project), finds the region and then sheet id of for that region's Regional Project List'''
-        saas_row= saas_sheet_df.loc[saas_sheet_df['id'] == saas_row_id].iloc[0]
+    def region_from_saas_rowid(self, saas_row_id: int, saas_sheet:grid) -> str:
+        '''given a saas row id (project), finds the region for that region's Regional Project List'''
+        saas_row = saas_sheet.get_row(saas_row_id)
+        if saas_row is None:
+            raise ValueError(f"saas row {saas_row_id} is not on the SAAS sheet")
         region = saas_row['REGION']
         return region
 #endregion
 #region workspaces
     def save_as_new_wrkspc(self, template_id: str, name:str) ->dict:
         '''makes new workspace from another one as the template'''
-        return smart.Workspaces.copy_workspace(
+        new_wrkspc = self.smart.Workspaces.copy_workspace(
             template_id,           # workspace_id
             smartsheet.models.ContainerDestination({
                 'new_name': f"{name}"
                 })
             ).to_dict()
+        with self.wrkspc_index_lock:
+            if self.wrkspcs_by_permalink is not None and new_wrkspc.get("data"):
+                self.index_wrkspc(new_wrkspc.get("data"))
+        return new_wrkspc
     def get_wrkspcs(self) -> dict:
-        return smart.Workspaces.list_workspaces(include_all=True).to_dict()
+        return self.smart.Workspaces.list_workspaces(include_all=True).to_dict()
+    def index_wrkspc(self, workspace: dict):
+        '''adds/updates one workspace dict in the workspace index'''
+        old = self.wrkspcs_by_id.get(workspace.get("id"))
+        if old and self.wrkspcs_by_name.get(old.get("name")) is old:
+            del self.wrkspcs_by_name[old.get("name")]
+        self.wrkspcs_by_id[workspace.get("id")] = workspace
+        self.wrkspcs_by_name[workspace.get("name")] = workspace
+        if workspace.get("permalink"):
+            self.wrkspcs_by_permalink[workspace.get("permalink")] = workspace
+    def load_wrkspc_index(self):
+        '''one list_workspaces call, indexed by permalink, id and name (must hold wrkspc_index_lock)'''
+        logger.debug('Indexing Smartsheet workspaces...')
+        self.wrkspcs_by_permalink, self.wrkspcs_by_id, self.wrkspcs_by_name = {}, {}, {}
+        for workspace in self.get_wrkspcs().get('data'):
+            self.index_wrkspc(workspace)
+        self.wrkspc_index_misses = set()
+    def find_wrkspc(self, permalink:str=None, name:str=None) -> Optional[dict]:
+        '''looks a workspace up in the run's index, a miss refreshes the index once (so workspaces made outside this run are found), 
+        keys still missing after that refresh are remembered and not refreshed for again'''
+        index_name, value = ('wrkspcs_by_permalink', permalink) if permalink is not None else ('wrkspcs_by_name', name)
+        with self.wrkspc_index_lock:
+            if self.wrkspcs_by_permalink is None:
+                self.load_wrkspc_index()
+            workspace = getattr(self, index_name).get(value)
+            if workspace is None and (index_name, value) not in self.wrkspc_index_misses:
+                self.load_wrkspc_index()
+                workspace = getattr(self, index_name).get(value)
+                if workspace is None:
+                    self.wrkspc_index_misses.add((index_name, value))
+        return workspace
     def get_wrkspc_from_project_link(self, project: ProjectObj) -> dict:
-        '''generates a list of all workspaces, searches for a workspace with the given SS link and then returns the associated ID'''
-        wrkspc = None
-        get_workspace_data = self.get_wrkspcs()
-        workspace_list = get_workspace_data.get('data')
-        for workspace in workspace_list:
-            if workspace.get("permalink") == project.ss_link:
-                wrkspc = workspace
-        if project.ss_link == "none":
+        '''searches the workspace index for a workspace with the given SS link and then returns it
+        (the api has no lookup by permalink, so the index is the fastest route from link to id)'''
+        if project.ss_link == "none" or not project.ss_link:
             logger.debug('SS workspace update skipped due to lack of workspace existance')
-        elif wrkspc == None: 
+            return None
+        wrkspc = self.find_wrkspc(permalink=project.ss_link)
+        if wrkspc == None: 
             logger.warning(f'Permissions Error: Workspace not found from link ({project.ss_link})')
         return wrkspc
     def rename_wrkspc(self, wrkspc_id:int, name:str):
         logger.info('renaming the workspace...')
-        self.updated_workspace = smart.Workspaces.update_workspace(
+        self.updated_workspace = self.smart.Workspaces.update_workspace(
          wrkspc_id,       # workspace_id
          smartsheet.models.Workspace({
            'name': f"{name}"
          })
         )
+        with self.wrkspc_index_lock:
+            workspace = self.wrkspcs_by_id.get(wrkspc_id)
+            if workspace is not None:
+                self.index_wrkspc({**workspace, 'name': name})
     def audit_wrkspc_isnew(self):
         self.isnew_bool=True
-        response = smart.Workspaces.list_workspaces(include_all=True)
-        for workspace in response.to_dict().get("data"):
-            if workspace.get("name") == f'Project_{self.proj_dict.get("name")}_{self.proj_dict.get("enum")}':
-                self.isnew_bool = False
-                logger.info(f'a workspace audit within smartsheet revealed that Project_{self.proj_dict.get("name")}_{self.proj_dict.get("enum")} already exists')  
-    def wrkspc_shares_need_updating(self, project:ProjectObj, wrkspc_id: int) -> bool:
-        '''returns true if the workspace is missing user in shares group'''
-        response = smart.Workspaces.list_shares(
+        if self.find_wrkspc(name=f'Project_{self.proj_dict.get("name")}_{self.proj_dict.get("enum")}') is not None:
+            self.isnew_bool = False
+            logger.info(f'a workspace audit within smartsheet revealed that Project_{self.proj_dict.get("name")}_{self.proj_dict.get("enum")} already exists')  
+    def get_wrkspc_shares(self, wrkspc_id: int) -> list:
+        '''current shares on a workspace as dicts (one list call, reuse the result for planning + checking)'''
+        return self.smart.Workspaces.list_shares(
             wrkspc_id,       # workspace_id
-            include_all=True)
-        current_shares = [share.get('name') for share in response.to_dict()['data']]
-        required_shares = project.users
-        required_shares.extend(['Smartsheet Admin', 'Project-Admins', 'Project-Review', 'Field_Admins'])
-        for share in required_shares:
-            if share not in current_shares:
-                return True
-        return False 
-    def ss_permission_setting(self, project: ProjectObj, wrkspc_id: int):
-        '''sharing the workspace with those who need it + standard project admin'''
-        logger.info('Configuring Workspace permissions...')
-        email_list = project.user_emails
-        shares = [
-            {'type': 'email', 'value': email, 'access_level': 'ADMIN'} for email in email_list
+            include_all=True).to_dict()['data']
+    def required_wrkspc_shares(self, project: ProjectObj) -> list:
+        '''every share a project workspace should have: the project users + standard project admin groups'''
+        return [
+            {'type': 'email', 'value': email, 'access_level': 'ADMIN'} for email in project.user_emails
         ] + [
             {'type': 'groupId', 'value': ss_config['field_admins_id'], 'access_level': 'ADMIN'},
             {'type': 'groupId', 'value': ss_config['project_admins_id'], 'access_level': 'ADMIN'},
             {'type': 'groupId', 'value': ss_config['project_review_id'], 'access_level': 'EDITOR'}
         ]
+    def plan_wrkspc_shares(self, project: ProjectObj, wrkspc_id: int, current_shares: Optional[list] = None) -> list:
+        '''the required shares that are not on the workspace yet (current_shares is fetched if not given)'''
+        if current_shares is None:
+            current_shares = self.get_wrkspc_shares(wrkspc_id)
+        shared_emails = {share.get('email').lower() for share in current_shares if share.get('email')}
+        shared_groups = {str(share.get('groupId')) for share in current_shares if share.get('groupId')}
+        return [
+            share for share in self.required_wrkspc_shares(project)
+            if (share['type'] == 'email' and share['value'].lower() not in shared_emails)
+            or (share['type'] == 'groupId' and str(share['value']) not in shared_groups)
+        ]
+    def wrkspc_shares_need_updating(self, project:ProjectObj, wrkspc_id: int, current_shares: Optional[list] = None) -> bool:
+        '''returns true if the workspace is missing a user or group it should be shared with'''
+        return bool(self.plan_wrkspc_shares(project, wrkspc_id, current_shares))
+    def share_wrkspc(self, wrkspc_id: int, share: dict):
+        '''applies one planned share, ApiError here means someone shared it in the meantime'''
+        share_data = smartsheet.models.Share({
+            'access_level': share['access_level'],
+            share['type']: share['value']
+        })
+        try:
+            self.smart.Workspaces.share_workspace(wrkspc_id, share_data)
+        except ApiError:
+            logger.debug(f"{share['value']} already has access to workspace")
+    def ss_permission_setting(self, project: ProjectObj, wrkspc_id: int, current_shares: Optional[list] = None):
+        '''sharing the workspace with those who need it + standard project admin
+        only the missing shares are sent: in one bulk request, or one by one (ss_config "share_workers" at a time) if the bulk request is rejected'''
+        logger.info('Configuring Workspace permissions...')
+        missing_shares = self.plan_wrkspc_shares(project, wrkspc_id, current_shares)
+        if not missing_shares:
+            logger.debug('workspace already has every share it needs')
+            return
 
-        for share in shares:
-            share_data = smartsheet.models.Share({
-                'access_level': share['access_level'],
-                share['type']: share['value']
-            })
-
-            try:
-                smart.Workspaces.share_workspace(wrkspc_id, share_data)
-            except ApiError:
-                if share['type'] == 'email':
-                    logger.debug(f"{share['value']} already has access to workspace")
-                else:
-                    group_name = share['value']
-                    logger.debug(f"{group_name} already has access to workspace")
+        try:
+            self.smart.Workspaces.share_workspace(wrkspc_id, [
+                smartsheet.models.Share({'access_level': share['access_level'], share['type']: share['value']})
+                for share in missing_shares
+            ])
+            return
+        except ApiError as e:
+            logger.debug(f"bulk share was rejected ({e}), sharing one at a time")
+
+        max_workers = max(1, min(ss_config.get('share_workers', 4), len(missing_shares)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(propagate(lambda share: self.share_wrkspc(wrkspc_id, share)), missing_shares))
 #endregion
 #region posting 
-    def generate_posting_data(self, project: ProjectObj) -> PostingData:
-        """Generates PostingData for the project."""
-        sheet = self.handle_cached_smartsheets(project.region, ss_config["regional_sheetid_obj"][project.region])
-        sheet_columns = sheet.get_column_df()
+    def generate_posting_data(self, project: ProjectObj, eg:bool=True, ss:bool=True) -> PostingData:
+        """Generates PostingData for the project (eg/ss=False leaves that link out)."""
+        sheet = self.handle_cached_smartsheets(project.region, self.regional_sheet_id(project.region))
+        sheet.load_column_schema()
 
         # Retrieve required IDs
-        eg_column_id = sheet_columns.loc[sheet_columns['title'] == "EGNYTE", "id"].squeeze()
-        ss_column_id = sheet_columns.loc[sheet_columns['title'] == "SMARTSHEET", "id"].squeeze()
-        regional_row_id = sheet.df.loc[sheet.df['ENUMERATOR'] == project.enum, "id"].squeeze()
+        eg_column_id = sheet.column_title_to_id["EGNYTE"]
+        ss_column_id = sheet.column_title_to_id["SMARTSHEET"]
+        regional_row_id = self.regional_row_id_from_enum(sheet, project.enum)
 
         # Populate links list based on conditions
         post = []
-        if project.need_new_eg:
+        if project.need_new_eg and eg:
            post.append({'column_id': int(eg_column_id), 'link': project.eg_link})
-        if project.need_new_ss:
+        if project.need_new_ss and ss:
             post.append({'column_id': int(ss_column_id), 'link': project.ss_link})
 
         return PostingData(
@@ -395,41 +494,27 @@ class SmartsheetClient():
             regional_row_id=int(regional_row_id),
             post=post
         )
-    def post_resulting_links(self, project:ProjectObj):
-        '''posts links that were created to the regional Project List'''
-        posting_data = self.generate_posting_data(project)
-        
-        new_row = smart.models.Row()
-        new_row.id = posting_data.regional_row_id
-
-        for cell in posting_data.post:
-            new_cell = smart.models.Cell()
-            new_cell.column_id = cell.get("column_id")
-            new_cell.value = cell.get("link")
-            new_cell.strict = False
-            new_row.cells.append(new_cell)
-
-        if new_row.cells:
-            response = smart.Sheets.update_rows(posting_data.regional_sheet_id, [new_row])
-            if response.message == "SUCCESS":
-                logger.info(f'Link-post into {project.region} Project List complete')
-            else:
-                logger.warning("Looks like links didn't post! Check ss_client.post_resulting_links for bugs.")
+    def post_resulting_links(self, project:ProjectObj, eg:bool=True, ss:bool=True):
+        '''queues the links that were created for the regional Project List, they go out with that sheet's batch (flush_posts() at the end of the run)
+        eg/ss=False leaves that link out (main.py queues the egnyte link once the template copy landed)'''
+        posting_data = self.generate_posting_data(project, eg=eg, ss=ss)
+
+        cells = {cell.get("column_id"): cell.get("link") for cell in posting_data.post}
+        if cells:
+            self.write_buffer.add(posting_data.regional_sheet_id, posting_data.regional_row_id, cells, label=f"{project.name} links")
+            logger.info(f'Link-post into {project.region} Project List queued')
     def post_update_checkbox(self, saas_row_id:int):
-        '''checks checkbox for more recent item with given enum for updatings (this could get buggy if two back to back requests exist)'''
-        new_cell = smart.models.Cell({'column_id' : ss_config['saas_update_check_column_id'], 'value': "1", 'strict': False})
-        new_row = smart.models.Row({'id':saas_row_id})
-        new_row.cells.append(new_cell)
-
-        if str(new_row.to_dict().get("cells")) != "None":
-            # Update rows
-            updated_row = smart.Sheets.update_rows(
-              ss_config['saas_id'],      # sheet_id
-              [new_row])
-            if updated_row.message == 'SUCCESS':
-                logger.info(f'checked update bool in Saas Admin Page')
-            else:
-                logger.info(f'update bool checkbox posting had result of {updated_row.message}')
+        '''queues the checkbox for more recent item with given enum for updatings (this could get buggy if two back to back requests exist)'''
+        self.write_buffer.add(ss_config['saas_id'], saas_row_id, {ss_config['saas_update_check_column_id']: "1"}, label="update checkbox")
+        logger.info(f'update bool in Saas Admin Page queued')
+    def flush_posts(self) -> List[RowWriteResult]:
+        '''sends every queued post as batched update_rows calls and logs the per-row report'''
+        results = self.write_buffer.flush()
+        failed = [result for result in results if not result.success]
+        logger.info(f"posted {len(results) - len(failed)}/{len(results)} row updates")
+        for result in failed:
+            logger.warning(f"row {result.row_id} ({result.label}) on sheet {result.sheet_id} did not post: {result.error}")
+        return results
 #endregion
 
 if __name__ == "__main__":
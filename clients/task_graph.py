@@ -0,0 +1,99 @@
+#region imports and variables
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Callable, List
+import logging
+from clients.instrumentation import propagate
+from configs.setup_logger import setup_logger
+logger = setup_logger(__name__, level=logging.DEBUG)
+#endregion
+
+#region Models
+@dataclass
+class Task:
+    name: str
+    fn: Callable # called with the results of deps, in deps order
+    deps: List[str] = field(default_factory=list)
+@dataclass
+class TaskGraphReport:
+    name: str
+    wall_s: float
+    critical_path: List[str] # the chain of dependent steps that decided wall_s
+    critical_path_s: float
+    step_s: dict # {task name: seconds}
+
+    def __str__(self):
+        return (
+            f"{self.name}: {self.wall_s:.2f}s, critical path {self.critical_path_s:.2f}s ({' -> '.join(self.critical_path)}), "
+            f"steps: {', '.join(f'{name} {seconds:.2f}s' for name, seconds in self.step_s.items())}")
+#endregion
+
+class TaskGraph():
+    '''
+    Runs a set of steps as soon as the steps they depend on are done, up to max_workers at a time.
+    Steps have to be added after their deps (so the graph can't have cycles). The first error stops new steps from
+    starting, lets the running ones finish and is then raised.
+    '''
+    def __init__(self, name:str):
+        self.name = name
+        self.tasks = {}
+        self.results = {}
+        self.report = None
+
+    def add(self, name:str, fn:Callable, deps:list=None):
+        deps = list(deps or [])
+        unknown = [dep for dep in deps if dep not in self.tasks]
+        if unknown:
+            raise ValueError(f"{name} depends on {unknown}, which are not in {self.name} (add them first)")
+        self.tasks[name] = Task(name=name, fn=fn, deps=deps)
+    def run_task(self, task:Task, dep_results:list):
+        started_at = time.perf_counter()
+        result = task.fn(*dep_results)
+        return result, time.perf_counter() - started_at
+    def run(self, max_workers:int=4) -> TaskGraphReport:
+        '''runs every step, results end up in self.results, returns (and keeps in self.report) the timing report'''
+        started_at = time.perf_counter()
+        pending = dict(self.tasks)
+        running = {}
+        step_s = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            while pending or running:
+                if error is None:
+                    for name, task in list(pending.items()):
+                        if all(dep in self.results for dep in task.deps):
+                            del pending[name]
+                            # propagate keeps the caller's instrumentation tags (SAAS row + phase) on the step's calls
+                            future = executor.submit(propagate(self.run_task), task, [self.results[dep] for dep in task.deps])
+                            running[future] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name], step_s[name] = future.result()
+                    except Exception as e:
+                        logger.error(f"{self.name}: {name} failed: {e}")
+                        error = error or e
+        if error is not None:
+            raise error
+        self.report = self.build_report(time.perf_counter() - started_at, step_s)
+        return self.report
+    def build_report(self, wall_s:float, step_s:dict) -> TaskGraphReport:
+        '''critical path = the dependency chain with the largest summed step time'''
+        path_s = {}
+        path_prev = {}
+        for name, task in self.tasks.items():
+            slowest_dep = max(task.deps, key=lambda dep: path_s[dep], default=None)
+            path_s[name] = step_s[name] + (path_s[slowest_dep] if slowest_dep else 0)
+            path_prev[name] = slowest_dep
+        last = max(path_s, key=path_s.get, default=None)
+        critical_path = []
+        while last is not None:
+            critical_path.insert(0, last)
+            last = path_prev[last]
+        return TaskGraphReport(
+            name=self.name, wall_s=wall_s, critical_path=critical_path,
+            critical_path_s=sum(step_s[name] for name in critical_path), step_s=step_s)
@@ -0,0 +1,122 @@
+#region imports and variables
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, List
+import smartsheet
+from smartsheet.exceptions import ApiError
+import logging
+from configs.setup_logger import setup_logger
+logger = setup_logger(__name__, level=logging.DEBUG)
+# smartsheet's limit on rows per update_rows request
+max_rows_per_request = 500
+# api errors a single row can cause (a value that fails validation, a deleted row), only these are worth retrying row by row
+row_error_statuses = (400, 404)
+#endregion
+
+#region Models
+@dataclass
+class RowWriteResult:
+    sheet_id: str
+    row_id: int
+    label: str
+    success: bool
+    error: Optional[str] = None
+@dataclass
+class PendingRow:
+    label: str
+    cells: dict = field(default_factory=dict) # {column_id: value}
+#endregion
+
+class RowWriteBuffer():
+    '''
+    Write-behind buffer for cell updates: rows are collected per sheet during the run and sent as batched update_rows calls,
+    either when a sheet has flush_threshold rows waiting, when a row is added with immediate=True or when flush() is called (end of run).
+
+    A batch the api rejects because of its rows (row_error_statuses) is retried row by row so one bad row only fails itself,
+    any other failure (auth, a dropped connection, ...) would fail every row the same way, so it fails the batch's rows without
+    retrying them. Every row ends up in results and a failure never stops the other sheets from being sent.
+
+    Sends to the same sheet are serialized (one lock per sheet id), so rows posting from different threads never write
+    to one sheet at the same time.
+    '''
+    def __init__(self, smart:smartsheet.Smartsheet, flush_threshold:int=100):
+        self.smart = smart
+        self.flush_threshold = min(flush_threshold, max_rows_per_request)
+        self.pending = {} # {sheet_id: {row_id: PendingRow}}
+        self.results: List[RowWriteResult] = []
+        self.lock = threading.Lock()
+        self.sheet_locks = {} # {sheet_id: threading.Lock}
+
+    def add(self, sheet_id:str, row_id:int, cells:dict, label:str="", immediate:bool=False) -> Optional[RowWriteResult]:
+        '''queues cells ({column_id: value}) for a row, cells for a row that is already queued are merged in
+        immediate=True sends the sheet's queue (this row included) right away, for writes that must not wait for the end of the run
+        returns the row's result when it was sent by this call, None while it is still queued'''
+        with self.lock:
+            rows = self.pending.setdefault(sheet_id, {})
+            row = rows.setdefault(row_id, PendingRow(label=label))
+            row.cells.update(cells)
+            ready = rows if immediate or len(rows) >= self.flush_threshold else None
+            if ready is not None:
+                del self.pending[sheet_id]
+        if ready is None:
+            return None
+        results = self.send(sheet_id, ready)
+        return next((result for result in results if result.row_id == row_id), None)
+    def flush(self) -> List[RowWriteResult]:
+        '''sends everything still waiting and returns the per-row results of the whole run'''
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for sheet_id, rows in pending.items():
+            self.send(sheet_id, rows)
+        with self.lock:
+            return list(self.results)
+    def sheet_lock(self, sheet_id:str) -> threading.Lock:
+        '''returns the send lock for a sheet, creating it on first use'''
+        with self.lock:
+            return self.sheet_locks.setdefault(sheet_id, threading.Lock())
+    def build_row(self, row_id:int, pending_row:PendingRow) -> smartsheet.models.Row:
+        new_row = smartsheet.models.Row()
+        new_row.id = row_id
+        for column_id, value in pending_row.cells.items():
+            new_cell = smartsheet.models.Cell()
+            new_cell.column_id = column_id
+            new_cell.value = value
+            new_cell.strict = False
+            new_row.cells.append(new_cell)
+        return new_row
+    def send(self, sheet_id:str, rows:dict) -> List[RowWriteResult]:
+        '''update_rows in chunks of max_rows_per_request (one send per sheet at a time), returns the rows' results'''
+        results = []
+        row_ids = list(rows)
+        with self.sheet_lock(sheet_id):
+            for start in range(0, len(row_ids), max_rows_per_request):
+                results += self.send_chunk(sheet_id, row_ids[start:start + max_rows_per_request], rows)
+        return results
+    def send_chunk(self, sheet_id:str, chunk:list, rows:dict) -> List[RowWriteResult]:
+        '''one update_rows call, a chunk rejected because of its rows falls back to one row per request'''
+        try:
+            self.smart.Sheets.update_rows(sheet_id, [self.build_row(row_id, rows[row_id]) for row_id in chunk])
+            logger.debug(f"posted {len(chunk)} row(s) to sheet {sheet_id}")
+            return self.record(sheet_id, chunk, rows, None)
+        except Exception as e:
+            if len(chunk) == 1 or not is_row_error(e):
+                return self.record(sheet_id, chunk, rows, str(e))
+            logger.warning(f"batch post of {len(chunk)} rows to sheet {sheet_id} failed ({e}), retrying row by row")
+            results = []
+            for row_id in chunk:
+                results += self.send_chunk(sheet_id, [row_id], rows)
+            return results
+    def record(self, sheet_id:str, row_ids:list, rows:dict, error:Optional[str]) -> List[RowWriteResult]:
+        results = [
+            RowWriteResult(sheet_id=sheet_id, row_id=row_id, label=rows[row_id].label, success=error is None, error=error)
+            for row_id in row_ids]
+        with self.lock:
+            self.results += results
+        if error is not None:
+            posted = f"row {row_ids[0]} ({rows[row_ids[0]].label})" if len(row_ids) == 1 else f"{len(row_ids)} rows"
+            logger.warning(f"post of {posted} to sheet {sheet_id} failed: {error}")
+        return results
+
+def is_row_error(error:Exception) -> bool:
+    '''True when the api rejected the request because of (some of) its rows'''
+    return isinstance(error, ApiError) and getattr(error.error.result, "status_code", None) in row_error_statuses
@@ -0,0 +1,38 @@
+import json
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+
+class LazyConfig(Mapping):
+    """
+    Read-only view of a json config file that is read the first time a key is asked for (then kept for the process),
+    so importing a module that holds one never touches the disk.
+
+    :param path: Path of the json file, relative to the working directory like the rest of configs/.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.values = None
+        self.lock = threading.Lock()
+
+    def load(self) -> dict:
+        with self.lock:
+            if self.values is None:
+                self.values = json.loads(self.path.read_text())
+        return self.values
+    def use(self, values:dict):
+        '''replaces the file's contents for the rest of the process (offline replay / bench runs, see tools/bench.py)'''
+        with self.lock:
+            self.values = dict(values)
+    def __getitem__(self, key):
+        return self.load()[key]
+    def __iter__(self):
+        return iter(self.load())
+    def __len__(self):
+        return len(self.load())
+    def __repr__(self):
+        return f"LazyConfig({str(self.path)!r}, loaded={self.values is not None})"
+
+# one instance per file, shared by every module that reads it
+ss_config = LazyConfig("configs/ss_config.json")
+eg_config = LazyConfig("configs/eg_config.json")
@@ -1,124 +1,223 @@
 #region imports and variables
 import os
+import argparse
 import sys
 from datetime import datetime
 import json
 import re
-import pandas as pd
-import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from typing import Optional
 from pathlib import Path
-from clients.eg_client import EgnyteClient
-from clients.ss_client import SmartsheetClient, ProjectObj, PostingData
+import asyncio
+from clients.app_context import AppContext
+from clients.ss_client import ProjectObj, PostingData
+from clients.eg_client import CopyJob
+from clients.instrumentation import recorder, tag
+from clients.task_graph import TaskGraph
+from configs.app_config import ss_config, eg_config
 import logging
 from configs.setup_logger import setup_logger
 logger = setup_logger(__name__, level=logging.DEBUG)
-ss_config = json.loads(Path("configs/ss_config.json").read_text())
-eg_config = json.loads(Path("configs/eg_config.json").read_text())
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 #endregion
 
-ss_client = SmartsheetClient()
-eg_client = EgnyteClient()
+# configs and clients are loaded on first use, importing this module does no config or network i/o
+app = AppContext()
+
+# one lock per shared resource (a project's egnyte group + workspace) so concurrent rows never write to the same thing at once,
+# sheet posts are queued in app.ss_client.write_buffer, which sends to one sheet at a time
+resource_locks = {}
+resource_locks_guard = threading.Lock()
+
+def resource_lock(key:str) -> threading.Lock:
+    '''returns the lock for a shared resource, creating it on first use'''
+    with resource_locks_guard:
+        if key not in resource_locks:
+            resource_locks[key] = threading.Lock()
+        return resource_locks[key]
 
 def new_ss_workspace(project: ProjectObj):
     '''this uses the SS client to create a new project workspace from the template, giving it appropriate permissions and then posting the link back to the project list'''
     logger.info(f"Creating Smartsheet Workspace for {project.name}...")
-    new_wrkspc = ss_client.save_as_new_wrkspc(ss_config['wkspc_template_id'], project.ss_workspace_name)
+    new_wrkspc = app.ss_client.save_as_new_wrkspc(ss_config['wkspc_template_id'], project.ss_workspace_name)
     new_wrkspc_id = new_wrkspc.get("data").get("id")
     project.ss_link = new_wrkspc.get("data").get("permalink")
-    ss_client.ss_permission_setting(project, new_wrkspc_id)
+    app.ss_client.ss_permission_setting(project, new_wrkspc_id)
     logger.info("SS creation complete")
 def update_ss_workspace(project:ProjectObj):
     '''updates an existing workspace with the current information, changes name if needed, changes permissions if needed'''
     logger.info(f"Updating Smartsheet Workspace for {project.name}")
-    wrkspc = ss_client.get_wrkspc_from_project_link(project)
+    wrkspc = app.ss_client.get_wrkspc_from_project_link(project)
     if wrkspc is None:
         logger.debug("Smartsheet update not needed (workspace not found).")
         return
 
     if wrkspc.get('name') != project.ss_workspace_name:
-        ss_client.rename_wrkspc(wrkspc['id'], project.ss_workspace_name),
+        app.ss_client.rename_wrkspc(wrkspc['id'], project.ss_workspace_name),
     
-    if ss_client.wrkspc_shares_need_updating(project, wrkspc['id']):
-        ss_client.ss_permission_setting(project, wrkspc['id'])
+    current_shares = app.ss_client.get_wrkspc_shares(wrkspc['id'])
+    if app.ss_client.wrkspc_shares_need_updating(project, wrkspc['id'], current_shares):
+        app.ss_client.ss_permission_setting(project, wrkspc['id'], current_shares)
 
     logger.info("SS update complete")
-def new_eg_folder(project:ProjectObj):
-    '''generates path to new folder, creates folder from path, generates new permission group with users, shares various permission groups to folder, copies template, restricts delete, generates link and posts it to ss'''
+def new_eg_folder(project:ProjectObj, on_copy_done=None) -> Optional[CopyJob]:
+    '''generates path to new folder, then runs the provisioning steps as a dependency graph (eg_config "provisioning_workers" at a time):
+    folder creation and permission group creation run together, once both exist the group is shared to the folder,
+    the delete restriction and link (from create_folder's folder id) only wait for the folder.
+    the template copy is submitted to eg_client.template_copies once every other step went through (on_copy_done(job) runs
+    once it landed and posts the link, so a failed step never leaves a copy behind that posts it), with eg_config
+    "async_template_copy" false it runs inline as soon as the folder exists. the timing report (critical path per project) is logged.
+    returns the background template copy, None when the copy ran inline'''
     logger.info(f"Creating Egnyte Folder for {project.name}...")
+    eg_client = app.eg_client
     eg_client.generate_eg_project_path(project)
-    new_folder = eg_client.create_folder(project)
-    permission_members = eg_client.prepare_new_permission_group(project)
-    permission_group_id = eg_client.generate_permission_group(permission_members, project)
-    folder_permission_api_dict = eg_client.set_permissions_on_new_folder(project)
-    folder_move_api_dict = eg_client.copy_folders_to_new_location(source_path = eg_config['eg_template_path'], destination_path = project.eg_path)
-    restrict_api_dict = eg_client.restrict_move_n_delete(project)
-    posting_data = eg_client.generate_folder_link(project)
+    steps = TaskGraph(f"EG folder for {project.name}_{project.enum}")
+    steps.add("create_folder", lambda: eg_client.create_folder(project))
+    steps.add("prepare_group", lambda: eg_client.prepare_new_permission_group(project))
+    steps.add("create_group", lambda members: eg_client.generate_permission_group(members, project), deps=["prepare_group"])
+    steps.add("set_permissions", lambda folder, group_id: eg_client.set_permissions_when_ready(project, group_id), deps=["create_folder", "create_group"])
+    steps.add("restrict_move_n_delete", lambda folder: eg_client.restrict_move_n_delete(project), deps=["create_folder"])
+    steps.add("folder_link", lambda folder: eg_client.generate_folder_link(project, folder.get("folder_id")), deps=["create_folder"])
+    if eg_config.get('async_template_copy', True):
+        # the copy is the slowest step, it is only submitted here and finishes in the background (main() waits for it),
+        # its on_copy_done posts the link, so it is only submitted once every other step went through
+        steps.add("copy_template", lambda permissions, restriction, link: eg_client.template_copies.submit(source_path = eg_config['eg_template_path'], destination_path = project.eg_path, on_done=on_copy_done), deps=["set_permissions", "restrict_move_n_delete", "folder_link"])
+    else:
+        steps.add("copy_template", lambda folder: eg_client.copy_folders_to_new_location(source_path = eg_config['eg_template_path'], destination_path = project.eg_path), deps=["create_folder"])
+    report = steps.run(max_workers=eg_config.get('provisioning_workers', 4))
+    logger.info(report)
     logger.debug('EG creation complete')
+    copy = steps.results["copy_template"]
+    return copy if isinstance(copy, CopyJob) else None
 def update_eg_folder(project:ProjectObj):
-    '''words'''
+    '''sync entry point for update_eg_folder_async, it runs on app.eg_async_client's event loop (shared by every row)'''
+    app.eg_async_client.run(update_eg_folder_async(project))
+async def update_eg_folder_async(project:ProjectObj):
+    '''finds the project's permission group from its folder, then renames the group and the folder together,
+    the group's members are reconciled once its rename is done'''
     correct_project_name = project.name + "_" + project.enum
     logger.info(f"updating Egnyte for {project.name}")
-    folder_id = eg_client.generate_id_from_url(project)
-    if folder_id:
-        #update permission group
-        group_id, group_name = eg_client.return_group_id_to_update(folder_id)
-        if group_id and group_name:
+    eg_async_client = app.eg_async_client
+    folder_id = app.eg_client.generate_id_from_url(project)
+    if not folder_id:
+        logger.warning('project update was skipped')
+        return
+    #update permission group
+    group_id, group_name = await eg_async_client.return_group_id_to_update(folder_id)
+    if group_id and group_name:
+        async def update_group():
             if group_name != correct_project_name + "_" + project.enum:
-                eg_client.change_permission_group_name(group_id, group_name)
-            updates = eg_client.group_member_updates(group_id, project)
-            if updates:
-                eg_client.execute_group_changes(updates, group_id)
-        
+                await eg_async_client.change_permission_group_name(group_id, group_name)
+            # after the rename and resending its name, an exact (PUT) reconcile would otherwise put back the name it read before
+            await eg_async_client.reconcile_group_members(group_id, project, display_name=group_name)
         #update folder name/location
-            if correct_project_name not in eg_client.handle_cached_paths(folder_id):   
+        async def update_folder_name():
+            if correct_project_name not in await eg_async_client.handle_cached_paths(folder_id):
                 logger.info(f"debugging folder_id: {folder_id}")
-                eg_client.change_folder_name(folder_id)
-    
-        logger.info("EG update complete")
-        return 
-    logger.warning('project update was skipped')
-def main_per_row(saas_row_id:int):
-    '''grabs data, optionally adds/updates ss/eg, posts'''
-    project = ss_client.build_proj_obj(
-        saas_row_id=saas_row_id)
+                await eg_async_client.change_folder_name(folder_id)
+        await asyncio.gather(update_group(), update_folder_name())
+    logger.info("EG update complete")
+def main_per_row(saas_row_id:int) -> Optional[CopyJob]:
+    '''grabs data, optionally adds/updates ss/eg, posts, returns the row's background template copy (None if it has none)'''
+    with tag(phase="build"):
+        project = app.ss_client.build_proj_obj(
+            saas_row_id=saas_row_id)
     logger.info(project)
-    
-    if project.need_new_ss:
-        new_ss_workspace(project)
 
-    if project.need_new_eg:
-        new_eg_folder(project)
+    # rows for the same project share an egnyte group + workspace, so the whole action phase is serialized per project
+    with resource_lock(f"{project.name}_{project.enum}"):
+        if project.need_new_ss:
+            with tag(phase="new_ss"):
+                new_ss_workspace(project)
+
+        copy_job = None
+        if project.need_new_eg:
+            # the egnyte link tells the next run the folder is done, so with a background template copy it is only queued once the copy landed
+            def post_eg_link(job:CopyJob):
+                with tag(phase="post"):
+                    app.ss_client.post_resulting_links(project, ss=False)
+            with tag(phase="new_eg"):
+                copy_job = new_eg_folder(project, on_copy_done=post_eg_link)
+
+        post_eg_link_now = project.need_new_eg and copy_job is None
+        if project.need_new_ss or post_eg_link_now:
+            with tag(phase="post"):
+                app.ss_client.post_resulting_links(project, eg=post_eg_link_now)
 
-    if project.need_new_eg or project.need_new_ss:
-        ss_client.post_resulting_links(project)
+        if project.need_update:
+            with tag(phase="update"):
+                update_eg_folder(project)
+                update_ss_workspace(project)
+            with tag(phase="post"):
+                app.ss_client.post_update_checkbox(saas_row_id)
+    return copy_job
 
-    if project.need_update:
-        update_eg_folder(project)
-        update_ss_workspace(project)
-        ss_client.post_update_checkbox(saas_row_id)
-        
 def identify_open_saas_rows():
     '''makes a df from the saas sheet (https://app.smartsheet.com/sheets/4X2m4ChQjgGh2gf2Hg475945rwVpV5Phmw69Gp61?view=grid&filterId=7982787065079684) 
     and looks for open rows, returns ids, names, and enums in three lists'''
-    saas_sheet = ss_client.handle_cached_smartsheets(region='SAAS', sheet_id=ss_config['saas_id'])
+    saas_sheet = app.ss_client.handle_cached_smartsheets(region='SAAS', sheet_id=ss_config['saas_id'])
     open_rows = saas_sheet.df.loc[saas_sheet.df['Saas Status'] == 'Open']
     return (
         open_rows['id'].values.tolist(),
         open_rows['New Name'].values.tolist(),
         open_rows['ENUMERATOR'].values.tolist()
     )
-def main():
-    '''takes open rows and then loops through, pushing each through the main func'''
-    saas_row_ids, project_names, enums = identify_open_saas_rows()
-    for i, (saas_row_id, project_name, enum) in enumerate(zip(saas_row_ids, project_names, enums), start=1):
-        logger.info(f"{i}/{len(saas_row_ids)}: {project_name}")
-        try:
-            main_per_row(saas_row_id)
-        except Exception as e:
-            logger.error(e)
-    logger.debug('finished!')
+def process_row(saas_row_id:int, project_name:str) -> tuple[bool, Optional[CopyJob]]:
+    '''runs one row inside a worker, errors are logged and kept to that row (progress is logged by main() as rows finish)
+    returns (the row went through, its background template copy), the row only counts as done once that copy is too'''
+    try:
+        with tag(saas_row=saas_row_id):
+            copy_job = main_per_row(saas_row_id)
+        return True, copy_job
+    except Exception as e:
+        logger.error(f"{project_name} (saas row {saas_row_id}) failed: {e}")
+        return False, None
+def main(max_workers:Optional[int]=None):
+    '''takes open rows and pushes each through the main func, up to max_workers rows at a time (ss_config "max_workers", default 1 = one row at a time)'''
+    if max_workers is None:
+        max_workers = ss_config.get('max_workers', 1)
+    with tag(phase="build"):
+        saas_row_ids, project_names, enums = identify_open_saas_rows()
+    total = len(saas_row_ids)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {
+                executor.submit(process_row, saas_row_id, project_name): position
+                for position, (saas_row_id, project_name) in enumerate(zip(saas_row_ids, project_names))
+            }
+            # progress is logged here, in the order rows finish, so concurrent rows can't interleave it
+            results = [None] * total
+            for finished, future in enumerate(as_completed(futures), start=1):
+                position = futures[future]
+                results[position] = future.result()
+                logger.info(f"{finished}/{total}: {project_names[position]} {'done' if results[position][0] else 'failed'}")
+        # the egnyte links of background template copies are queued as the copies land
+        copy_jobs = app.eg_client.template_copies.wait() if app.is_built("eg_client") else []
+    finally:
+        # queued posts (links + update checkboxes) go out as one batch per sheet, also when the run is interrupted
+        with tag(phase="post"):
+            app.ss_client.flush_posts()
+    if app.is_built("eg_async_client"):
+        app.eg_async_client.close()
+    copies_done = sum(job.status == "done" for job in copy_jobs)
+    rows_done = sum(row_done and (copy_job is None or copy_job.status == "done") for row_done, copy_job in results)
+    logger.debug(f'finished! {rows_done}/{total} rows succeeded, {copies_done}/{len(copy_jobs)} template copies done')
+    report_api_timing()
+def report_api_timing():
+    '''logs p50/p95/max latency per endpoint and per phase for this run, and writes the raw calls to ss_config "timing_export_path" when set'''
+    recorder.log_summary()
+    export_path = ss_config.get('timing_export_path')
+    if export_path:
+        recorder.export_json(export_path)
+        logger.info(f"api timing written to {export_path}")
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="processes the open SAAS rows")
+    parser.add_argument("--max-workers", type=int, default=None, help="rows at a time (default: ss_config max_workers)")
+    parser.add_argument("--refresh-users", action="store_true", help="refetch the egnyte user list instead of using the on-disk cache (same as eg_config refresh_user_cache)")
+    args = parser.parse_args()
+    if args.refresh_users:
+        app = AppContext(refresh_user_cache=True)
+    main(args.max_workers)
@@ -0,0 +1,257 @@
+#region imports and variables
+import json
+import time
+import uuid
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+from dataclasses import dataclass, asdict
+from typing import Optional
+import main
+from clients.app_context import AppContext
+from clients.eg_client import eg_api_url, eg_user_page_size
+from clients.grid import grid
+from clients.ss_client import ProjectObj
+from clients.instrumentation import recorder
+from clients.rate_limiter import rate_limiter
+from configs.app_config import ss_config, eg_config
+from tools.replay import FixtureStore, RecordingTransport, ReplayTransport, install
+from configs.setup_logger import setup_logger
+logger = setup_logger(__name__, level=logging.DEBUG)
+
+bench_sheet_id = 1000000000000001
+# configs the synthetic benchmarks run with (recorded runs bring their own, see record())
+bench_ss_config = {"smartsheet_admin_token": "bench", "sheet_snapshot_dir": ""}
+bench_eg_config = {"egnyte_token": "bench", "eg_template_path": "Shared/Projects/Template", "user_fetch_workers": 4}
+#endregion
+
+#region Models
+@dataclass
+class BenchResult:
+    name: str
+    wall_s: float
+    requests: int
+    retries: int
+    peak_memory_mb: Optional[float] = None
+    skipped: Optional[str] = None
+#endregion
+
+#region synthetic fixtures
+def sheet_fixture(store:FixtureStore, sheet_id:int, rows:int, columns:int=13):
+    '''a rows x columns sheet for GET /sheets/{id} + the sdk's columns request'''
+    column_dicts = [{"id": 7000000000000000 + i, "title": f"Column {i}", "index": i, "type": "TEXT_NUMBER"} for i in range(columns)]
+    store.add("GET", f"{grid.api_url}/sheets/{sheet_id}", body={
+        "id": sheet_id, "name": "Bench Sheet", "version": 1, "permalink": "https://app.smartsheet.com/sheets/bench",
+        "totalRowCount": rows, "columns": column_dicts,
+        "rows": [
+            {"id": 5000000000000000 + row, "rowNumber": row + 1, "cells": [
+                {"columnId": column["id"], "value": f"row {row} {column['title']}" if column["index"] % 3 else row}
+                for column in column_dicts]}
+            for row in range(rows)],
+    })
+    store.add("GET", f"{grid.api_url}/sheets/{sheet_id}/columns", exact=False, body={
+        "pageNumber": 1, "pageSize": columns, "totalPages": 1, "totalCount": columns, "data": column_dicts})
+def user_directory_fixture(store:FixtureStore, users:int) -> list:
+    '''users spread over the /v2/users pages generate_eg_user_list asks for, returns their emails'''
+    emails = [f"user{i}@bench.example" for i in range(users)]
+    for start in range(1, max(users, 1) + 1, eg_user_page_size):
+        store.add("GET", f"{eg_api_url}/v2/users?count={eg_user_page_size}&startIndex={start}", body={
+            "totalResults": users, "startIndex": start, "itemsPerPage": eg_user_page_size,
+            "resources": [
+                {"id": 1000 + i, "email": emails[i], "name": {"formatted": f"Bench User {i}"}}
+                for i in range(start - 1, min(start - 1 + eg_user_page_size, users))],
+        })
+    return emails
+def new_eg_folder_fixture(store:FixtureStore):
+    '''every egnyte endpoint new_eg_folder calls, answering for any path'''
+    folder_id = str(uuid.UUID(int=1))
+    store.add("POST", f"{eg_api_url}/v1/fs/Shared/bench", exact=False, body={"path": "/Shared/bench", "folder_id": folder_id})
+    store.add("POST", f"{eg_api_url}/v2/groups", exact=False, body={"id": "bench-group", "displayName": "bench"})
+    store.add("GET", f"{eg_api_url}/v2/groups/bench-group", body={"id": "bench-group", "displayName": "bench", "members": []})
+    store.add("POST", f"{eg_api_url}/v2/perms/Shared/bench", exact=False, status=204, headers={"Content-Type": "application/json"})
+    store.add("PATCH", f"{eg_api_url}/v1/fs/Shared/bench", exact=False, body={})
+    store.add("GET", f"{eg_api_url}/v1/fs/Shared/bench", exact=False, body={"path": "/Shared/bench", "folder_id": folder_id})
+def update_eg_folder_fixture(store:FixtureStore, emails:list) -> str:
+    '''every egnyte endpoint update_eg_folder calls (renamed folder, group missing the project's users), returns the folder id'''
+    folder_id = str(uuid.UUID(int=2))
+    store.add("GET", f"{eg_api_url}/v1/fs/ids/folder/{folder_id}", body={"path": "/Shared/Projects/WA/Old Name_99999", "folder_id": folder_id})
+    store.add("GET", f"{eg_api_url}/v2/perms/Shared", exact=False, body={"groupPerms": {"Projects": "Full", "Old Name_99999": "Full"}})
+    store.add("GET", f"{eg_api_url}/v2/groups", exact=False, body={"resources": [{"id": 4242, "displayName": "Old Name_99999"}]})
+    store.add("GET", f"{eg_api_url}/v2/groups/4242", body={"id": 4242, "displayName": "Old Name_99999", "members": [{"value": 1000}]})
+    store.add("PATCH", f"{eg_api_url}/v2/groups/4242", body={})
+    store.add("POST", f"{eg_api_url}/v1/fs/Shared", exact=False, body={})
+    return folder_id
+def bench_project(emails:list) -> ProjectObj:
+    return ProjectObj(
+        enum="99999", saas_row_id=1, name="Bench Project", region="NORCAL", job_type="Special Projects",
+        regional_sheet_id=str(bench_sheet_id), ss_link="", eg_link="", eg_path="tbd", action_type="New",
+        need_update=False, ss_workspace_name="Project_Bench Project_99999", need_new_ss=False, need_new_eg=True,
+        users=["PM", "PE", "SUP"], user_emails=emails[:3], state="WA")
+#endregion
+
+#region benchmarks
+# each one takes (args, temp_dir), prepares fixtures/configs/clients and returns the callable that is timed, or a str = skipped
+def bench_fetch_content(args, temp_dir:Path):
+    store = FixtureStore()
+    sheet_fixture(store, bench_sheet_id, args.rows)
+    use_configs(bench_ss_config, bench_eg_config, temp_dir)
+    main.app = AppContext()
+    main.app.ss_client # sets grid.token
+    replay(args, store)
+    return lambda: grid(bench_sheet_id).fetch_content()
+def bench_user_directory(args, temp_dir:Path):
+    store = FixtureStore()
+    user_directory_fixture(store, args.users)
+    use_configs(bench_ss_config, bench_eg_config, temp_dir)
+    main.app = AppContext(refresh_user_cache=True)
+    replay(args, store)
+    return lambda: main.app.eg_client.eg_users
+def bench_new_eg_folder(args, temp_dir:Path):
+    store = FixtureStore()
+    emails = user_directory_fixture(store, args.users)
+    new_eg_folder_fixture(store)
+    use_configs(bench_ss_config, bench_eg_config, temp_dir)
+    main.app = AppContext(refresh_user_cache=True)
+    replay(args, store)
+    # the user directory is loaded once per run, so it is warmed here and not part of the flow's time
+    main.app.eg_client.eg_users
+    project = bench_project(emails)
+    def run():
+        main.new_eg_folder(project)
+        main.app.eg_client.template_copies.wait()
+    return run
+def bench_update_eg_folder(args, temp_dir:Path):
+    store = FixtureStore()
+    emails = user_directory_fixture(store, args.users)
+    folder_id = update_eg_folder_fixture(store, emails)
+    use_configs(bench_ss_config, bench_eg_config, temp_dir)
+    main.app = AppContext(refresh_user_cache=True)
+    replay(args, store)
+    main.app.eg_client.eg_users
+    project = bench_project(emails)
+    project.eg_link = f"https://dowbuilt.egnyte.com/navigate/folder/{folder_id}"
+    return lambda: main.update_eg_folder(project)
+def bench_full_run(args, temp_dir:Path):
+    if not args.fixtures or not Path(args.fixtures).exists():
+        return "needs a recorded run, see: python -m tools.bench record"
+    store = FixtureStore.load(args.fixtures)
+    use_configs(store.meta.get("ss_config", {}), store.meta.get("eg_config", {}), temp_dir)
+    main.app = AppContext(refresh_user_cache=True)
+    replay(args, store)
+    return lambda: main.main(args.max_workers)
+benchmarks = {
+    "full_run": bench_full_run,
+    "fetch_content": bench_fetch_content,
+    "user_directory": bench_user_directory,
+    "new_eg_folder": bench_new_eg_folder,
+    "update_eg_folder": bench_update_eg_folder,
+}
+#endregion
+
+#region helpers
+def use_configs(ss_values:dict, eg_values:dict, temp_dir:Path):
+    '''runs on the given configs, with every on-disk cache (sheet snapshots, egnyte users, timing export) kept out of the way'''
+    ss_config.use({**ss_values, "sheet_snapshot_dir": "", "timing_export_path": None})
+    eg_config.use({**eg_values, "user_cache_path": str(temp_dir / "eg_user_cache.json")})
+def replay(args, store:FixtureStore):
+    install(ReplayTransport(store, latency=args.latency, jitter=args.jitter, throttle_rate=args.throttle_rate, seed=args.seed))
+def measure(name:str, args) -> BenchResult:
+    '''one timed pass, then (unless --no-memory) a second fresh pass under tracemalloc for the peak, tracemalloc slows the timed one down otherwise'''
+    with tempfile.TemporaryDirectory() as temp_dir:
+        run = benchmarks[name](args, Path(temp_dir))
+        if isinstance(run, str):
+            return BenchResult(name=name, wall_s=0, requests=0, retries=0, skipped=run)
+        calls_before = len(recorder.records)
+        started_at = time.perf_counter()
+        run()
+        wall = time.perf_counter() - started_at
+        calls = recorder.records[calls_before:]
+    peak = None
+    if not args.no_memory:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            run = benchmarks[name](args, Path(temp_dir))
+            tracemalloc.start()
+            try:
+                run()
+                peak = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+            finally:
+                tracemalloc.stop()
+    install(None)
+    return BenchResult(
+        name=name, wall_s=round(wall, 3), requests=len(calls), retries=sum(call.retries for call in calls), peak_memory_mb=peak)
+def quiet_logs():
+    '''the clients log every call at debug, bench output only wants warnings and up'''
+    for name in list(logging.root.manager.loggerDict):
+        if name == "main" or name.startswith(("clients.", "tools.")):
+            logging.getLogger(name).setLevel(logging.WARNING)
+#endregion
+
+def record(args):
+    '''
+    Runs main.main() against the real tenants with every call recorded into args.out (tokens scrubbed, see tools/replay.py).
+    This is a real run: open SAAS rows are processed and written to exactly as a normal run would.
+    Sheet snapshots and the egnyte user cache are bypassed so the recording holds every fetch a cold run makes.
+    '''
+    secrets = [ss_config.get("smartsheet_admin_token"), eg_config.get("egnyte_token")]
+    meta = {
+        "recorded_at": time.time(),
+        "ss_config": {**ss_config, "smartsheet_admin_token": "REDACTED"},
+        "eg_config": {**eg_config, "egnyte_token": "REDACTED"},
+    }
+    store = FixtureStore(secrets=secrets, meta=meta)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        use_configs(ss_config.load(), eg_config.load(), Path(temp_dir))
+        main.app = AppContext(refresh_user_cache=True)
+        install(RecordingTransport(store))
+        try:
+            main.main(args.max_workers)
+        finally:
+            install(None)
+            store.save(args.out)
+def run(args):
+    if not args.verbose:
+        quiet_logs()
+    if args.no_throttle:
+        rate_limiter.limits = {}
+    results = [measure(name, args) for name in (args.only or benchmarks)]
+    for result in results:
+        if result.skipped:
+            print(f"{result.name:<17} skipped ({result.skipped})")
+        else:
+            memory = f"{result.peak_memory_mb}MB" if result.peak_memory_mb is not None else "-"
+            print(f"{result.name:<17} {result.wall_s:>8.3f}s  {result.requests:>5} requests  {result.retries:>3} retries  peak {memory}")
+    if args.json:
+        Path(args.json).write_text(json.dumps([asdict(result) for result in results], indent=2))
+def main_cli():
+    parser = argparse.ArgumentParser(description="offline benchmarks on replayed smartsheet/egnyte fixtures")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks against replayed fixtures (no network)")
+    run_parser.add_argument("--only", nargs="+", choices=list(benchmarks))
+    run_parser.add_argument("--fixtures", help="recorded run for full_run (made with the record command)")
+    run_parser.add_argument("--rows", type=int, default=5000, help="rows of the fetch_content sheet")
+    run_parser.add_argument("--users", type=int, default=1500, help="size of the synthetic egnyte user directory")
+    run_parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every replayed call")
+    run_parser.add_argument("--jitter", type=float, default=0.02, help="up to this many extra seconds per call")
+    run_parser.add_argument("--throttle-rate", type=float, default=0, help="share of calls answered 429 (Retry-After: 0)")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--max-workers", type=int, default=None, help="rows at a time for full_run (default: ss_config max_workers)")
+    run_parser.add_argument("--no-throttle", action="store_true", help="turn the client side rate limiter off")
+    run_parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    run_parser.add_argument("--json", help="also write the results here")
+    run_parser.add_argument("--verbose", action="store_true", help="keep the clients' debug logs")
+
+    record_parser = commands.add_parser("record", help="record a real run into a fixture file (makes real changes!)")
+    record_parser.add_argument("--out", required=True, help="fixture file, ex. fixtures/run.json (fixtures/ is git ignored, recordings hold tenant data)")
+    record_parser.add_argument("--max-workers", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+    else:
+        run(args)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,61 @@
+#region imports and variables
+import re
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+repo_root = Path(__file__).resolve().parent.parent
+# a no-op start (interpreter + import main, nothing else) must stay well under a second, today it takes ~0.3s
+default_budget_seconds = 0.5
+# run in a fresh interpreter: checks nothing was loaded or built on import, then reports what import main cost
+probe = (
+    "import time; started_at = time.perf_counter(); import main; seconds = time.perf_counter() - started_at\n"
+    "assert not main.app.clients, f'clients built at import: {sorted(main.app.clients)}'\n"
+    "assert main.ss_config.values is None and main.eg_config.values is None, 'configs read at import'\n"
+    "print(f'import_seconds={seconds:.4f}')\n"
+)
+#endregion
+
+def run_probe(*flags) -> subprocess.CompletedProcess:
+    result = subprocess.run([sys.executable, *flags, "-c", probe], cwd=repo_root, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{result.stderr[-2000:]}")
+    return result
+def measure(runs:int=3) -> dict:
+    '''best of runs fresh-interpreter starts (wall time of the whole process + time spent in "import main"),
+    plus one -X importtime run for the per module breakdown (kept separate, it slows the import down)'''
+    best = None
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        result = run_probe()
+        wall = time.perf_counter() - started_at
+        if best is None or wall < best["wall_seconds"]:
+            import_seconds = float(re.search(r"import_seconds=([\d.]+)", result.stdout).group(1))
+            best = {"wall_seconds": wall, "import_seconds": import_seconds}
+    modules = []
+    for line in run_probe("-X", "importtime").stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            modules.append((match.group(4), int(match.group(2)) / 1e6, (len(match.group(3)) - 1) // 2))
+    best["modules"] = modules
+    return best
+def main():
+    parser = argparse.ArgumentParser(description="checks that importing main.py is lazy and fits the startup budget")
+    parser.add_argument("--budget", type=float, default=default_budget_seconds, help="max seconds for a no-op start (interpreter + import main)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8, help="how many of the slowest imports made by main.py to list")
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    print(f"no-op start: {result['wall_seconds']:.3f}s (import main {result['import_seconds']:.3f}s), budget {args.budget:.3f}s")
+    direct_imports = sorted((m for m in result["modules"] if m[2] == 1), key=lambda m: -m[1])
+    for name, seconds, _ in direct_imports[:args.top]:
+        print(f"  {seconds:.3f}s  {name}")
+    if result["wall_seconds"] > args.budget:
+        print("over budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#region imports and variables
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qsl, urlencode
+from pathlib import Path
+import requests
+from requests.structures import CaseInsensitiveDict
+from clients.instrumentation import endpoint_from_path
+from clients.rate_limiter import rate_limiter
+import logging
+from configs.setup_logger import setup_logger
+logger = setup_logger(__name__, level=logging.DEBUG)
+
+# bump whenever the fixture file shape changes, older files are then refused
+fixture_version = 1
+# response headers worth keeping, everything else (cookies, request ids, ...) is dropped when recording
+kept_headers = ("Content-Type", "Retry-After")
+# query params and json fields whose values are secrets
+secret_pattern = re.compile(r'("(?:access_token|accessToken|refresh_token|token|password)"\s*:\s*")[^"]*(")', re.IGNORECASE)
+secret_params = ("access_token", "token")
+#endregion
+
+def scrub(text:str, secrets:list) -> str:
+    '''replaces the known secrets (the configs' api tokens) and any token-looking json field with REDACTED'''
+    for secret in secrets:
+        if secret:
+            text = text.replace(secret, "REDACTED")
+    return secret_pattern.sub(r"\1REDACTED\2", text)
+def request_query(url) -> str:
+    '''the query string with params sorted and secret params dropped, so equal requests always look the same'''
+    params = sorted((key, value) for key, value in parse_qsl(url.query, keep_blank_values=True) if key not in secret_params)
+    return urlencode(params)
+def body_hash(body) -> str:
+    if body is None:
+        return ""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if not isinstance(body, bytes):
+        return ""
+    return hashlib.sha1(body).hexdigest()
+
+class FixtureStore():
+    '''
+    Recorded (or generated) request/response pairs, saved as one json file. A request is answered by the first match of:
+
+    1. method + host + path + query + request body hash
+    2. method + host + path + query
+    3. method + host + endpoint (clients.instrumentation.endpoint_from_path, so ids and egnyte paths are wildcards)
+
+    Responses recorded for the same key are replayed in order, the last one repeats once they run out.
+    Generated fixtures can be endpoint-only (add(..., exact=False)) to answer any id / path.
+    '''
+    def __init__(self, calls:list=None, secrets:list=None, meta:dict=None):
+        self.secrets = secrets or []
+        # anything the replay needs besides the calls (tools/bench.py keeps the scrubbed configs of the recorded run here)
+        self.meta = meta or {}
+        self.calls = []
+        self.indexes = ({}, {}, {})
+        self.served = {}
+        self.lock = threading.Lock()
+        for call in calls or []:
+            self.index(call)
+
+    @classmethod
+    def load(cls, path) -> 'FixtureStore':
+        fixtures = json.loads(Path(path).read_text())
+        if fixtures.get("version") != fixture_version:
+            raise ValueError(f"{path} is fixture version {fixtures.get('version')}, expected {fixture_version}")
+        return cls(fixtures.get("calls"), meta=fixtures.get("meta"))
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            path.write_text(json.dumps({"version": fixture_version, "meta": self.meta, "calls": self.calls}))
+        logger.info(f"wrote {len(self.calls)} fixture calls to {path}")
+    def keys(self, method:str, host:str, path:str, query:str, request_body_hash:str) -> tuple:
+        return (
+            f"{method} {host}{path}?{query}#{request_body_hash}",
+            f"{method} {host}{path}?{query}",
+            f"{method} {host}{endpoint_from_path(path)}",
+        )
+    def index(self, call:dict):
+        '''must hold self.lock (or be called before the store is shared)'''
+        self.calls.append(call)
+        keys = self.keys(call["method"], call["host"], call["path"], call.get("query", ""), call.get("body_hash", ""))
+        levels = range(3) if call.get("exact", True) else (2,)
+        for level in levels:
+            self.indexes[level].setdefault(keys[level], []).append(call)
+    def add(self, method:str, url:str, status:int=200, body="", headers:dict=None, request_body=None, exact:bool=True):
+        '''adds a response; body may be a dict/list (sent as json) or text'''
+        parsed = urlparse(url)
+        if not isinstance(body, str):
+            body = json.dumps(body)
+            headers = {"Content-Type": "application/json", **(headers or {})}
+        call = {
+            "method": method.upper(), "host": parsed.hostname, "path": parsed.path, "query": request_query(parsed),
+            "body_hash": body_hash(request_body), "exact": exact,
+            "status": status, "headers": dict(headers or {}), "body": scrub(body, self.secrets),
+        }
+        with self.lock:
+            self.index(call)
+    def record(self, request:requests.PreparedRequest, resp:requests.models.Response):
+        '''stores a live response, scrubbed (request headers, and with them the Authorization header, are never kept)'''
+        try:
+            body = resp.content.decode(resp.encoding or "utf-8")
+        except UnicodeDecodeError:
+            logger.debug(f"not recording the binary response of {request.method} {request.url}")
+            return
+        headers = {key: resp.headers[key] for key in kept_headers if key in resp.headers}
+        self.add(request.method, scrub(request.url, self.secrets), resp.status_code, body, headers, request.body)
+    def match(self, request:requests.PreparedRequest):
+        '''the fixture call that answers request, None if nothing matches'''
+        url = urlparse(request.url)
+        keys = self.keys(request.method, url.hostname, url.path, request_query(url), body_hash(request.body))
+        with self.lock:
+            for level, key in enumerate(keys):
+                calls = self.indexes[level].get(key)
+                if calls:
+                    position = self.served.get(key, 0)
+                    self.served[key] = position + 1
+                    return calls[min(position, len(calls) - 1)]
+        return None
+def build_response(request:requests.PreparedRequest, status:int, body:str, headers:dict) -> requests.models.Response:
+    resp = requests.models.Response()
+    resp.status_code = status
+    resp.reason = requests.status_codes._codes.get(status, ("",))[0].upper()
+    resp.headers = CaseInsensitiveDict(headers)
+    resp._content = body.encode("utf-8")
+    resp._content_consumed = True
+    resp.encoding = "utf-8"
+    resp.url = request.url
+    resp.request = request
+    return resp
+
+class RecordingTransport():
+    '''sends to the network and records every response into store (install() it, run the flow, then store.save())'''
+    def __init__(self, store:FixtureStore):
+        self.store = store
+
+    def send(self, network_send, request, **kwargs):
+        resp = network_send(request, **kwargs)
+        self.store.record(request, resp)
+        return resp
+class ReplayTransport():
+    '''
+    Answers from a FixtureStore without touching the network.
+
+    latency (+ up to jitter) seconds are slept per call to stand in for the real round trip, and throttle_rate of the
+    calls answer 429 with Retry-After: retry_after so the rate limiter's retry path is exercised.
+    Unmatched requests get a 404 and are kept in misses.
+    '''
+    def __init__(self, store:FixtureStore, latency:float=0, jitter:float=0, throttle_rate:float=0, retry_after:float=0, seed=None):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.misses = []
+
+    def send(self, network_send, request, **kwargs):
+        with self.random_lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            throttled = self.random.random() < self.throttle_rate
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            return build_response(request, 429, '{"errorCode": 4003, "message": "Rate limit exceeded.", "refId": "replay"}', {
+                "Content-Type": "application/json", "Retry-After": str(self.retry_after)})
+        call = self.store.match(request)
+        if call is None:
+            logger.warning(f"no fixture for {request.method} {request.url}")
+            self.misses.append(f"{request.method} {request.url}")
+            return build_response(request, 404, '{"errorCode": 1006, "message": "Not Found (no fixture)", "refId": "replay"}', {
+                "Content-Type": "application/json"})
+        return build_response(request, call["status"], call["body"], call["headers"])
+
+def install(transport):
+    '''routes every rate limited session (grid, SmartsheetClient, EgnyteClient) through transport, None goes back to the network'''
+    rate_limiter.transport = transport